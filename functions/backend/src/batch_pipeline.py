@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-Document Batch Runs for HealthGuard AI.
+
+'main_pipeline.py <gcs_uri>' analyzes one document per process, so re-analyzing a
+whole requirements repository means thousands of cold process launches. This
+module runs many documents through one shared, warm RAGPipeline instead: URIs
+come from a manifest file or a GCS prefix, a bounded job queue feeds a fixed
+number of document workers, and each document's result is appended to a JSONL
+file as soon as it finishes.
+
+Usage:
+    python batch_pipeline.py gs://bucket/requirements/ --output results.jsonl
+    python batch_pipeline.py uris.txt --document-workers 4 --requirement-workers 8
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Iterable, Iterator, Dict, Any, Optional
+
+# File types RAGPipeline._read_document can read.
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+
+
+def iter_document_uris(source: str, storage_client=None) -> Iterator[str]:
+    """
+    Yields the document URIs to process.
+
+    Args:
+        source: A gs://bucket/prefix whose supported documents are all processed, or the
+            path of a manifest file with one gs:// URI per line ('#' starts a comment).
+        storage_client: The Cloud Storage client used to list a prefix.
+    """
+    if source.startswith("gs://"):
+        bucket_name, _, prefix = source[len("gs://"):].partition("/")
+        for blob in storage_client.list_blobs(bucket_name, prefix=prefix or None):
+            if blob.name.lower().endswith(SUPPORTED_EXTENSIONS):
+                yield f"gs://{bucket_name}/{blob.name}"
+        return
+
+    with open(source, "r", encoding="utf-8") as f:
+        for line in f:
+            uri = line.split("#", 1)[0].strip()
+            if uri:
+                yield uri
+
+
+def run_document(pipeline, gcs_uri: str) -> Dict[str, Any]:
+    """
+    Runs the pipeline for one document and returns its JSONL record; failures are recorded, not raised.
+    """
+    started = time.perf_counter()
+    record: Dict[str, Any] = {"gcs_uri": gcs_uri}
+    try:
+        record["results"] = pipeline.run_pipeline(gcs_uri)
+        record["status"] = "ok"
+    except Exception as e:
+        logging.error(f"Batch job failed for {gcs_uri}: {e}", exc_info=True)
+        record["status"] = "error"
+        record["error"] = str(e)
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def run_batch(pipeline, uris: Iterable[str], output_path: str, document_workers: int = 2) -> Dict[str, Any]:
+    """
+    Runs documents through one shared pipeline and appends a JSONL record per document.
+
+    Requirement-level concurrency within each document is the pipeline's own max_workers.
+
+    Args:
+        pipeline: The warm RAGPipeline shared by all document workers.
+        uris: The document URIs, consumed lazily so a large manifest is never held in memory.
+        output_path: The JSONL file records are appended to as each document finishes.
+        document_workers: Maximum number of documents processed at the same time.
+
+    Returns:
+        A summary with the number of documents "succeeded" and "failed", and "seconds".
+    """
+    started = time.perf_counter()
+    workers = max(1, document_workers)
+    # A bounded queue keeps the producer only a little ahead of the workers.
+    jobs: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=workers * 2)
+    summary = {"succeeded": 0, "failed": 0}
+    write_lock = threading.Lock()
+
+    with open(output_path, "a", encoding="utf-8") as output:
+        def worker():
+            while True:
+                gcs_uri = jobs.get()
+                if gcs_uri is None:
+                    return
+                record = run_document(pipeline, gcs_uri)
+                with write_lock:
+                    output.write(json.dumps(record) + "\n")
+                    output.flush()
+                    summary["succeeded" if record["status"] == "ok" else "failed"] += 1
+                    done = summary["succeeded"] + summary["failed"]
+                logging.info(f"Batch: finished {gcs_uri} ({record['status']}, {record['seconds']}s); {done} documents done.")
+
+        threads = [threading.Thread(target=worker, name=f"batch-{i}", daemon=True) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for gcs_uri in uris:
+                jobs.put(gcs_uri)
+        finally:
+            for _ in threads:
+                jobs.put(None)
+            for thread in threads:
+                thread.join()
+
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    logging.info(
+        f"Batch finished: {summary['succeeded']} succeeded, {summary['failed']} failed "
+        f"in {summary['seconds']}s. Results in {output_path}"
+    )
+    return summary
+
+
+def main():
+    """
+    Runs every document in a manifest or GCS prefix through one warm pipeline.
+    """
+    # Loads .env before the defaults below are read.
+    from config import BATCH_DOCUMENT_WORKERS
+
+    parser = argparse.ArgumentParser(description="Run the HealthGuard pipeline over many documents.")
+    parser.add_argument("source", help="A gs://bucket/prefix, or a manifest file with one gs:// URI per line.")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file to append results to.")
+    parser.add_argument("--document-workers", type=int, default=BATCH_DOCUMENT_WORKERS,
+                        help="Documents processed at the same time (default BATCH_DOCUMENT_WORKERS).")
+    parser.add_argument("--requirement-workers", type=int, default=None,
+                        help="Requirements processed at the same time within each document (default PIPELINE_MAX_WORKERS).")
+    args = parser.parse_args()
+
+    from main_pipeline import RAGPipeline
+
+    pipeline = RAGPipeline(max_workers=args.requirement_workers)
+    uris = iter_document_uris(args.source, pipeline.storage_client if args.source.startswith("gs://") else None)
+    summary = run_batch(pipeline, uris, args.output, args.document_workers)
+    print(f"SUCCESS:{os.path.abspath(args.output)}", flush=True)
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
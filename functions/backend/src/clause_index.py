@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Regulatory Clause Index and Test Coverage for HealthGuard AI.
+
+Compliance scores used to grow with the number of test cases, whatever they
+tested. This module indexes the clauses of the documents in
+'compliance-knowledge-base/' (e.g. "21 CFR 820.30 Section 3", "IEC 62304 5.2.4")
+as a hierarchy, extracts the clause references that test cases cite, and
+measures which clauses the suite actually covers.
+
+Leaf clauses are numbered in hierarchy order, so every clause's leaves form one
+contiguous range. A clause with requirement text of its own (e.g. "IEC 62304
+Clause 5" above its sub-clauses) is a leaf as well, numbered before its
+sub-clauses. A reference to a leaf clause covers it. A reference to a broader
+clause (e.g. "21 CFR 820.30" when its sections are indexed, or a bare
+"IEC 62304") is too coarse to show which leaves were tested. It counts as one
+clause's worth of coverage, spread over its leaves, and is reported separately.
+Coverage is measured against the regulations the test cases cite, on a NumPy
+array of per-leaf credit painted once per distinct cited clause.
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+
+# A clause is keyed by its regulation ("21 CFR", "IEC 62304") and its number split on dots
+# ("820.30" -> ("820", "30")); the regulation itself has the empty number ().
+ClauseKey = Tuple[str, Tuple[str, ...]]
+
+_CFR_REFERENCE = re.compile(
+    r"\b(\d{1,2})\s*C\.?F\.?R\.?\s*(?:Part\s*)?(\d+(?:\.\d+)?)"
+    r"(?:\s*(?:,\s*)?(?:Section|Sec\.|§)\s*(\d+(?:\.\d+)*))?",
+    re.IGNORECASE
+)
+_STANDARD_REFERENCE = re.compile(
+    r"\b(IEC|ISO)\s*[- ]?(\d{4,5})(?:[-:]\d+)*(?:\s*(?:,\s*)?(?:Clause|Section|§)?\s*(\d+(?:\.\d+)*)\b)?",
+    re.IGNORECASE
+)
+_TITLE_LINE = re.compile(r"^Title:\s*(.+?)(?:\s+-\s+.*)?$", re.MULTILINE)
+_CLAUSE_HEADING = re.compile(r"^(?:Section|Clause)\s+(\d+(?:\.\d+)*)\s*:\s*(.*)$", re.MULTILINE)
+
+
+def extract_references(text: str) -> List[ClauseKey]:
+    """
+    Returns the clause references cited in a piece of text, e.g. "FDA 21 CFR 820.30",
+    "21 CFR 820.30 Section 3" or "IEC 62304 Clause 5.2.4".
+    """
+    references = []
+    for match in _CFR_REFERENCE.finditer(text):
+        number = tuple(match.group(2).split("."))
+        if match.group(3):
+            number += tuple(match.group(3).split("."))
+        references.append((f"{match.group(1)} CFR", number))
+    for match in _STANDARD_REFERENCE.finditer(text):
+        number = tuple(match.group(3).split(".")) if match.group(3) else ()
+        references.append((f"{match.group(1).upper()} {match.group(2)}", number))
+    return references
+
+
+def _regulation_and_number(text: str) -> Optional[ClauseKey]:
+    """
+    Parses a document title or regulation code ("FDA 21 CFR 820.30", "IEC 62304") into a clause key.
+    """
+    references = extract_references(text)
+    if references:
+        return references[0]
+    # Regulation codes without a section, e.g. "FDA 21CFR".
+    match = re.search(r"\b(\d{1,2})\s*CFR\b", text, re.IGNORECASE)
+    return (f"{match.group(1)} CFR", ()) if match else None
+
+
+def clause_label(key: ClauseKey) -> str:
+    regulation, number = key
+    return f"{regulation} {'.'.join(number)}".strip()
+
+
+class ClauseIndex:
+    """
+    The regulatory clauses of the knowledge base, with contiguous leaf numbering for coverage.
+    """
+
+    def __init__(self, clauses: Dict[ClauseKey, str], labels: Optional[Dict[ClauseKey, str]] = None,
+                 with_text: Iterable[ClauseKey] = ()):
+        """
+        Args:
+            clauses: Title of each clause, keyed by clause. Missing parent clauses and regulations are added.
+            labels: Display names of clauses whose number alone reads badly (see clause_label).
+            with_text: Clauses with requirement text of their own. Those with sub-clauses are
+                leaves too, so their own text is counted.
+        """
+        self.titles: Dict[ClauseKey, str] = dict(clauses)
+        self.labels: Dict[ClauseKey, str] = dict(labels or {})
+        with_text = set(with_text)
+        for regulation, number in list(clauses):
+            for depth in range(len(number)):
+                self.titles.setdefault((regulation, number[:depth]), "")
+
+        children: Dict[ClauseKey, List[ClauseKey]] = {}
+        for regulation, number in self.titles:
+            if number:
+                children.setdefault((regulation, number[:-1]), []).append((regulation, number))
+
+        def order(key: ClauseKey):
+            return key[0], tuple(int(part) if part.isdigit() else part for part in key[1])
+
+        # Leaves get consecutive numbers in depth-first order; each clause records its leaf range.
+        # A parent with its own text is the first leaf of its range, recorded in own_leaves.
+        self.leaves: List[ClauseKey] = []
+        self.ranges: Dict[ClauseKey, Tuple[int, int]] = {}
+        self.own_leaves: Dict[ClauseKey, int] = {}
+
+        def visit(key: ClauseKey):
+            first = len(self.leaves)
+            kids = sorted(children.get(key, []), key=order)
+            if kids:
+                if key in with_text:
+                    self.own_leaves[key] = first
+                    self.leaves.append(key)
+                for kid in kids:
+                    visit(kid)
+            else:
+                self.leaves.append(key)
+            self.ranges[key] = (first, len(self.leaves))
+
+        for key in sorted((key for key in self.titles if not key[1]), key=order):
+            visit(key)
+
+    def resolve(self, reference: ClauseKey) -> Optional[ClauseKey]:
+        """
+        Returns the most specific indexed clause a reference falls under, or None if it names
+        a clause the index does not have. A reference to a clause number outside the indexed
+        parts of a regulation does not resolve to the regulation as a whole.
+        """
+        regulation, number = reference
+        for depth in range(len(number), -1, -1):
+            key = (regulation, number[:depth])
+            if key in self.ranges:
+                if depth == 0 and number:
+                    return None
+                return key
+        return None
+
+    def label(self, key: ClauseKey) -> str:
+        return self.labels.get(key) or clause_label(key)
+
+    def coverage(self, test_cases: Iterable[Dict[str, Any]],
+                 regulations: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Measures which leaf clauses the test cases cover through the references in their
+        titles and descriptions.
+
+        Each leaf gets the credit of the most specific clause cited over it: 1 when the leaf
+        itself is cited, 1 / (number of leaves) when a broader clause is, so citing a parent
+        clause any number of times is worth one clause in total. Citing a parent with text of
+        its own covers that text, not its sub-clauses.
+
+        Args:
+            test_cases: The test cases; entries that are not dictionaries are skipped.
+            regulations: The regulations to measure against (e.g. "21 CFR", "IEC 62304").
+                Defaults to the indexed regulations the test cases cite.
+
+        Returns:
+            A dictionary with the "regulations" measured, the number of "covered" leaf clauses
+            (cited directly), the "weighted_covered" credit of their leaves and the "total"
+            number of their leaves; the "covered_clauses", "partially_covered_clauses" (under
+            a coarse reference only) and "uncovered_clauses" labels; the "coarse_references"
+            to indexed clauses broader than a leaf; and the "unresolved_references" to clauses
+            that are not indexed.
+        """
+        cited = set()
+        unresolved = set()
+        for test_case in test_cases:
+            if not isinstance(test_case, dict):
+                continue
+            text = f"{test_case.get('title', '')} {test_case.get('description', '')}"
+            for reference in extract_references(text):
+                key = self.resolve(reference)
+                if key is None:
+                    unresolved.add(clause_label(reference))
+                else:
+                    cited.add(key)
+
+        # Cited ranges are nested or disjoint; painting the widest first leaves every leaf with
+        # the credit of its most specific cited clause.
+        credit = np.zeros(len(self.leaves), dtype=np.float64)
+        coarse = []
+        for key in sorted(cited, key=lambda key: self.ranges[key][0] - self.ranges[key][1]):
+            if key in self.own_leaves:
+                credit[self.own_leaves[key]] = 1.0
+                continue
+            first, last = self.ranges[key]
+            credit[first:last] = 1.0 / (last - first)
+            if last - first > 1:
+                coarse.append(self.label(key))
+
+        # Each regulation's leaves are one contiguous range.
+        regulations = sorted({key[0] for key in cited} if regulations is None else set(regulations))
+        in_scope = np.zeros(len(self.leaves), dtype=bool)
+        for regulation in regulations:
+            first, last = self.ranges.get((regulation, ()), (0, 0))
+            in_scope[first:last] = True
+        credit = credit[in_scope]
+        labels = [self.label(key) for key, keep in zip(self.leaves, in_scope) if keep]
+        return {
+            "regulations": regulations,
+            "covered": int((credit == 1.0).sum()),
+            "weighted_covered": round(float(credit.sum()), 2),
+            "total": len(labels),
+            "covered_clauses": [label for label, value in zip(labels, credit) if value == 1.0],
+            "partially_covered_clauses": [label for label, value in zip(labels, credit) if 0.0 < value < 1.0],
+            "uncovered_clauses": [label for label, value in zip(labels, credit) if value == 0.0],
+            "coarse_references": sorted(coarse),
+            "unresolved_references": sorted(unresolved),
+        }
+
+    @classmethod
+    def from_knowledge_base(cls, root: str) -> "ClauseIndex":
+        """
+        Indexes the clauses of the knowledge base: "Section"/"Clause" headings of its text files,
+        under the regulation and clause in their "Title:" line, and the regulation and numbered
+        title of each JSON metadata file.
+        """
+        clauses: Dict[ClauseKey, str] = {}
+        labels: Dict[ClauseKey, str] = {}
+        with_text = set()
+        for directory, _, files in os.walk(root):
+            for name in sorted(files):
+                path = os.path.join(directory, name)
+                extension = os.path.splitext(name)[1].lower()
+                try:
+                    if extension in (".txt", ".md"):
+                        with open(path, "r", encoding="utf-8") as f:
+                            text = f.read()
+                        title = _TITLE_LINE.search(text)
+                        base = _regulation_and_number(title.group(1)) if title else None
+                        if base is None:
+                            continue
+                        clauses.setdefault(base, title.group(1).strip())
+                        headings = list(_CLAUSE_HEADING.finditer(text))
+                        for heading, following in zip(headings, headings[1:] + [None]):
+                            key = (base[0], base[1] + tuple(heading.group(1).split(".")))
+                            clauses[key] = heading.group(2).strip()
+                            if text[heading.end():following.start() if following else len(text)].strip():
+                                with_text.add(key)
+                            # e.g. "21 CFR 820.30 Section 3" rather than "21 CFR 820.30.3"
+                            if base[1]:
+                                labels[key] = f"{clause_label(base)} {heading.group(0).split()[0]} {heading.group(1)}"
+                    elif extension == ".json":
+                        with open(path, "r", encoding="utf-8") as f:
+                            metadata = json.load(f)
+                        base = _regulation_and_number(str(metadata.get("regulation_code", "")))
+                        if base is None:
+                            continue
+                        number = re.match(r"\s*(\d+(?:\.\d+)*)\b", str(metadata.get("document_title", "")))
+                        key = (base[0], base[1] + (tuple(number.group(1).split(".")) if number else ()))
+                        clauses.setdefault(key, str(metadata.get("document_title", "")))
+                except (OSError, ValueError) as e:
+                    logging.warning(f"Skipping {path} while indexing clauses: {e}")
+        return cls(clauses, labels, with_text)
+
+
+_default_index: Optional[ClauseIndex] = None
+_default_index_lock = threading.Lock()
+
+
+def get_clause_index() -> ClauseIndex:
+    """
+    Returns the clause index of the knowledge base at LOCAL_SEARCH_KB_PATH, built once per process.
+
+    Raises:
+        FileNotFoundError: If the knowledge base directory does not exist.
+        ValueError: If no regulatory clauses could be indexed from it.
+    """
+    # Imported here so the index itself does not need the pipeline configuration.
+    from config import LOCAL_SEARCH_KB_PATH
+
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            if not os.path.isdir(LOCAL_SEARCH_KB_PATH):
+                raise FileNotFoundError(f"Compliance knowledge base not found at: {LOCAL_SEARCH_KB_PATH}")
+            index = ClauseIndex.from_knowledge_base(LOCAL_SEARCH_KB_PATH)
+            if not index.leaves:
+                raise ValueError(f"No regulatory clauses could be indexed from {LOCAL_SEARCH_KB_PATH}.")
+            _default_index = index
+            logging.info(f"Indexed {len(index.leaves)} regulatory clauses from {LOCAL_SEARCH_KB_PATH}")
+        return _default_index
@@ -1,5 +1,6 @@
 # backend/src/config.py
 import os
+import tempfile
 from dotenv import load_dotenv
 import logging
 
@@ -30,6 +31,13 @@ except FileNotFoundError as e:
     # You might want to exit or handle this more gracefully depending on your application's needs
     # For the hackathon, we'll log the error and let the individual modules fail if the var is missing.
 
+
+def resolve_project_path(path: str) -> str:
+    """Resolves a relative path against the project root, so it does not depend on the working directory."""
+    if not path or os.path.isabs(path):
+        return path
+    return os.path.join(globals().get("PROJECT_ROOT") or os.getcwd(), path)
+
 # --- GCP Settings ---
 GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 GCP_REGION = os.getenv("GCP_REGION")
@@ -42,10 +50,79 @@ PROCESSOR_DISPLAY_NAME = os.getenv("PROCESSOR_DISPLAY_NAME")
 PROCESSOR_TYPE = os.getenv("PROCESSOR_TYPE")
 BUCKET_PREFIX = os.getenv("BUCKET_PREFIX")
 SAMPLE_DOC_PATH = os.getenv("SAMPLE_DOC_PATH")
+# Documents per Document AI batch operation when batch-processing a GCS prefix.
+DOCAI_BATCH_MAX_DOCUMENTS = int(os.getenv("DOCAI_BATCH_MAX_DOCUMENTS", "1000"))
+DOCAI_BATCH_POLL_SECONDS = float(os.getenv("DOCAI_BATCH_POLL_SECONDS", "15"))
+# Batch-processed documents whose output JSON is structured concurrently.
+DOCAI_STRUCTURE_WORKERS = int(os.getenv("DOCAI_STRUCTURE_WORKERS", "8"))
 
 # --- Day 2 Settings ---
 DATA_STORE_DISPLAY_NAME = os.getenv("DATA_STORE_DISPLAY_NAME")
 ENGINE_DISPLAY_NAME = os.getenv("ENGINE_DISPLAY_NAME")
+# Concurrent uploads when syncing the knowledge base to GCS (unchanged files are skipped).
+GCS_UPLOAD_WORKERS = int(os.getenv("GCS_UPLOAD_WORKERS", "8"))
+# Documents per Vertex AI Search import operation, and how often running imports are polled.
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "100"))
+IMPORT_POLL_SECONDS = float(os.getenv("IMPORT_POLL_SECONDS", "5"))
+
+# --- Pipeline Performance Settings ---
+# Maximum number of requirements searched and generated concurrently by RAGPipeline.
+PIPELINE_MAX_WORKERS = int(os.getenv("PIPELINE_MAX_WORKERS", "8"))
+# Documents larger than this are streamed from GCS in chunks instead of downloaded into memory.
+GCS_STREAM_THRESHOLD_BYTES = int(os.getenv("GCS_STREAM_THRESHOLD_BYTES", str(32 * 1024 * 1024)))
+# Processes used to extract text from long PDFs (0 = one per CPU), and the page count at which they are used.
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "0"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+# Per-document record of previous runs, so unchanged requirements reuse their test cases (empty disables).
+PIPELINE_HISTORY_PATH = os.getenv("PIPELINE_HISTORY_PATH", os.path.join(tempfile.gettempdir(), "healthguard_run_history.sqlite3"))
+PIPELINE_HISTORY_MAX_BYTES = int(os.getenv("PIPELINE_HISTORY_MAX_BYTES", str(256 * 1024 * 1024)))
+# Results file format: "json" (one document) or "ndjson" (a record per test case, then the compliance analysis), optionally gzipped.
+PIPELINE_OUTPUT_FORMAT = os.getenv("PIPELINE_OUTPUT_FORMAT", "json").lower()
+PIPELINE_OUTPUT_GZIP = os.getenv("PIPELINE_OUTPUT_GZIP", "false").lower() in ("1", "true", "yes")
+# Approximate prompt token budget for packing several requirements into one Gemini request (0 disables).
+GEMINI_BATCH_TOKEN_BUDGET = int(os.getenv("GEMINI_BATCH_TOKEN_BUDGET", "6000"))
+# Upper bound on requirements per packed request, keeping the reply within the model's output limit.
+GEMINI_BATCH_MAX_REQUIREMENTS = int(os.getenv("GEMINI_BATCH_MAX_REQUIREMENTS", "5"))
+# On-disk cache of Gemini responses shared by all worker processes (set to an empty string to disable).
+GEMINI_CACHE_PATH = os.getenv("GEMINI_CACHE_PATH", os.path.join(tempfile.gettempdir(), "healthguard_gemini_cache.sqlite3"))
+GEMINI_CACHE_MAX_BYTES = int(os.getenv("GEMINI_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+GEMINI_CACHE_TTL_SECONDS = float(os.getenv("GEMINI_CACHE_TTL_SECONDS", "0"))  # 0 = no expiry
+# Approximate document tokens per requirement extraction prompt; larger documents are split into parts (0 disables).
+GEMINI_EXTRACTION_TOKEN_BUDGET = int(os.getenv("GEMINI_EXTRACTION_TOKEN_BUDGET", "12000"))
+# Approximate tokens repeated between consecutive parts so requirements on a boundary are not cut in half.
+GEMINI_EXTRACTION_OVERLAP_TOKENS = int(os.getenv("GEMINI_EXTRACTION_OVERLAP_TOKENS", "400"))
+# Stream Gemini replies and parse JSON array objects as they arrive instead of waiting for the whole reply.
+GEMINI_STREAMING = os.getenv("GEMINI_STREAMING", "true").lower() in ("1", "true", "yes")
+# Violation rule file used by the compliance analysis (empty = compliance_rules.json next to violation_rules.py).
+COMPLIANCE_RULES_PATH = resolve_project_path(os.getenv("COMPLIANCE_RULES_PATH", ""))
+# Compliance search cache: in memory, and on disk when SEARCH_CACHE_PATH is set (empty keeps it in memory only).
+# Entries also expire whenever documents are imported into the data store.
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", os.path.join(tempfile.gettempdir(), "healthguard_search_cache.sqlite3"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024"))
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "86400"))
+# Compliance search backend: "vertex" (Vertex AI Search), "local" (BM25) or "dense" (embeddings) over the local knowledge base.
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "vertex").lower()
+# The local compliance knowledge base; relative paths are resolved against the project root.
+LOCAL_SEARCH_KB_PATH = resolve_project_path(os.getenv("LOCAL_SEARCH_KB_PATH", "compliance-knowledge-base"))
+# Where the BM25 index is saved between runs (empty rebuilds it in memory each run).
+LOCAL_SEARCH_INDEX_PATH = os.getenv("LOCAL_SEARCH_INDEX_PATH", os.path.join(tempfile.gettempdir(), "healthguard_compliance_bm25.json"))
+# Dense backend embedder ("hashing" is deterministic and offline, "gemini" calls the embedding API) and index directory.
+DENSE_EMBEDDER = os.getenv("DENSE_EMBEDDER", "hashing").lower()
+DENSE_EMBEDDING_DIM = int(os.getenv("DENSE_EMBEDDING_DIM", "384"))
+DENSE_INDEX_PATH = os.getenv("DENSE_INDEX_PATH", os.path.join(tempfile.gettempdir(), "healthguard_compliance_dense"))
+
+# --- Pipeline Worker Settings ---
+# Address and concurrent job limit of the long-lived worker (python pipeline_worker.py --serve).
+PIPELINE_WORKER_HOST = os.getenv("PIPELINE_WORKER_HOST", "127.0.0.1")
+PIPELINE_WORKER_PORT = int(os.getenv("PIPELINE_WORKER_PORT", "8765"))
+PIPELINE_WORKER_MAX_JOBS = int(os.getenv("PIPELINE_WORKER_MAX_JOBS", "4"))
+# When set, main_pipeline.py sends jobs to the worker at this URL instead of running the pipeline itself.
+PIPELINE_WORKER_URL = os.getenv("PIPELINE_WORKER_URL", "")
+# Documents processed at the same time by python batch_pipeline.py <manifest | gs://prefix>.
+BATCH_DOCUMENT_WORKERS = int(os.getenv("BATCH_DOCUMENT_WORKERS", "2"))
+# Seconds a warm Cloud Function instance reuses its pipeline and clients before rebuilding them (0 = never expire).
+PIPELINE_MAX_AGE_SECONDS = float(os.getenv("PIPELINE_MAX_AGE_SECONDS", "3600"))
 
 # --- Validation ---
 REQUIRED_VARS = [
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Credential Error Detection for HealthGuard AI.
+
+Long-lived pipelines (warm Cloud Function instances, the pipeline worker) reuse
+their clients across runs, so rotated or revoked credentials only show up as API
+errors. Several stages turn API errors into fallback results (an error string
+for search, demo test cases for Gemini) instead of raising. Those stages use
+is_credentials_error to recognize authentication failures and record them, so
+the owner of the pipeline can rebuild its clients.
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+from typing import Optional
+
+
+def is_credentials_error(error: Optional[BaseException]) -> bool:
+    """
+    True for errors that fresh clients (with newly loaded credentials) may fix: failed token
+    refreshes, and Unauthenticated or PermissionDenied API errors. Wrapped errors are
+    recognized through their __cause__.
+    """
+    try:
+        from google.api_core import exceptions as api_exceptions
+        from google.auth import exceptions as auth_exceptions
+    except ImportError:
+        # Without the Google client libraries there are no Google credentials to fail.
+        return False
+
+    credential_errors = (auth_exceptions.RefreshError, api_exceptions.Unauthenticated, api_exceptions.PermissionDenied)
+    while error is not None:
+        if isinstance(error, credential_errors):
+            return True
+        error = error.__cause__
+    return False
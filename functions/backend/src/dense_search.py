@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Dense (Semantic) Retrieval over the Compliance Knowledge Base.
+
+Passages of 'compliance-knowledge-base/' are embedded once and stored as a
+contiguous float32 matrix in a .npy file next to a JSON manifest. The matrix is
+opened memory-mapped, so every worker process on a host shares the same page
+cache pages instead of loading its own copy. Queries are answered in batches
+with a single matrix product and argpartition top-k selection.
+
+The embedder is pluggable: HashingEmbedder is deterministic and runs locally
+(useful for tests and offline runs), GeminiEmbedder calls the Gemini embedding API.
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from lazy_imports import lazy_import
+from local_search import corpus_fingerprint, read_corpus_passages, tokenize
+
+genai = lazy_import("google.generativeai")
+
+EMBEDDINGS_FILE = "embeddings.npy"
+MANIFEST_FILE = "manifest.json"
+
+
+class EmbeddingError(RuntimeError):
+    """
+    Raised when an embedder cannot embed texts (e.g. the embedding API call failed).
+    """
+
+
+def _l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class HashingEmbedder:
+    """
+    A deterministic local embedder that hashes unigrams and bigrams into a fixed-size vector.
+    """
+
+    def __init__(self, dimensions: int = 384):
+        self.dimensions: int = dimensions
+        self.name: str = f"hashing-{dimensions}"
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dimensions, 1.0 if (value >> 63) & 1 else -1.0
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Returns an L2-normalized float32 matrix with one row per text.
+        """
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                column, sign = self._bucket(feature)
+                vectors[row, column] += sign
+        return _l2_normalize(vectors)
+
+
+class GeminiEmbedder:
+    """
+    Embeds text with the Gemini embedding API.
+    """
+
+    def __init__(self, api_key: Optional[str], model: str = "models/text-embedding-004", batch_size: int = 100):
+        self.api_key: Optional[str] = api_key
+        self.model: str = model
+        self.batch_size: int = batch_size
+        self.name: str = f"gemini-{model}"
+        self._configured: bool = False
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Returns an L2-normalized float32 matrix with one row per text.
+
+        Raises:
+            EmbeddingError: If the embedding API call fails.
+        """
+        try:
+            if not self._configured:
+                # The pipeline's Gemini model may never have been created (e.g. every prompt was a
+                # cache hit), so genai is configured here rather than assumed to be.
+                genai.configure(api_key=self.api_key)
+                self._configured = True
+            rows: List[List[float]] = []
+            for start in range(0, len(texts), self.batch_size):
+                response = genai.embed_content(model=self.model, content=texts[start:start + self.batch_size])
+                rows.extend(response["embedding"])
+        except Exception as e:
+            raise EmbeddingError(f"Gemini embedding request failed: {e}") from e
+        return _l2_normalize(np.asarray(rows, dtype=np.float32).reshape(len(texts), -1))
+
+
+def create_embedder(name: str, dimensions: int = 384, api_key: Optional[str] = None):
+    """
+    Returns the embedder for a DENSE_EMBEDDER setting ("hashing" or "gemini").
+
+    Args:
+        name: The embedder name.
+        dimensions: Vector size of the hashing embedder.
+        api_key: Gemini API key used by the gemini embedder.
+    """
+    if name == "gemini":
+        return GeminiEmbedder(api_key)
+    if name == "hashing":
+        return HashingEmbedder(dimensions)
+    raise ValueError(f"Unknown dense embedder: {name}")
+
+
+class DenseComplianceIndex:
+    """
+    A matrix of passage embeddings, searched by cosine similarity.
+    """
+
+    def __init__(self, embedder, passages: List[Dict[str, str]], embeddings: np.ndarray, fingerprint: str = ""):
+        self.embedder = embedder
+        self.passages: List[Dict[str, str]] = passages
+        self.embeddings: np.ndarray = embeddings
+        self.fingerprint: str = fingerprint
+
+    @classmethod
+    def build(cls, root: str, embedder) -> "DenseComplianceIndex":
+        """
+        Embeds every passage of the compliance knowledge base under root.
+        """
+        passages = read_corpus_passages(root)
+        embeddings = embedder.embed([f"{p['title']}\n{p.pop('index_text')}" for p in passages])
+        logging.info(f"Built dense compliance index with {len(passages)} passages using {embedder.name}")
+        return cls(embedder, passages, np.ascontiguousarray(embeddings, dtype=np.float32),
+                   f"{embedder.name}|{corpus_fingerprint(root)}")
+
+    def save(self, directory: str):
+        """
+        Writes the embedding matrix and manifest into directory, replacing each file atomically.
+        The manifest is written last, so a reader never pairs it with a stale matrix.
+        """
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False, suffix=".npy") as f:
+            np.save(f, self.embeddings)
+        os.replace(f.name, os.path.join(directory, EMBEDDINGS_FILE))
+
+        manifest = {"fingerprint": self.fingerprint, "shape": list(self.embeddings.shape), "passages": self.passages}
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, delete=False, suffix=".json") as f:
+            json.dump(manifest, f)
+        os.replace(f.name, os.path.join(directory, MANIFEST_FILE))
+
+    @classmethod
+    def load(cls, directory: str, embedder) -> "DenseComplianceIndex":
+        """
+        Opens a saved index with its embedding matrix memory-mapped read-only.
+        """
+        with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r")
+        if list(embeddings.shape) != manifest["shape"]:
+            raise ValueError(f"Embedding matrix shape {embeddings.shape} does not match the manifest.")
+        return cls(embedder, manifest["passages"], embeddings, manifest["fingerprint"])
+
+    @classmethod
+    def load_or_build(cls, root: str, directory: Optional[str], embedder) -> "DenseComplianceIndex":
+        """
+        Memory-maps the saved index if it matches the corpus and embedder, otherwise rebuilds it.
+
+        Args:
+            root: The compliance knowledge base directory.
+            directory: Where the index is persisted. None keeps it in memory only.
+            embedder: The embedder used for passages and queries.
+        """
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"Compliance knowledge base not found at: {root}")
+
+        fingerprint = f"{embedder.name}|{corpus_fingerprint(root)}"
+        if directory and os.path.exists(os.path.join(directory, MANIFEST_FILE)):
+            try:
+                index = cls.load(directory, embedder)
+                if index.fingerprint == fingerprint:
+                    return index
+                logging.info("Compliance knowledge base or embedder changed; rebuilding the dense index.")
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Could not load dense compliance index from {directory}, rebuilding: {e}")
+
+        index = cls.build(root, embedder)
+        if directory:
+            try:
+                index.save(directory)
+                # Re-open memory-mapped so this process shares pages with the other workers.
+                return cls.load(directory, embedder)
+            except OSError as e:
+                logging.warning(f"Could not save dense compliance index to {directory}: {e}")
+        return index
+
+    def search_batch(self, queries: List[str], top_k: int = 3) -> List[List[Tuple[Dict[str, str], float]]]:
+        """
+        Answers many queries with one embedding call and one matrix product.
+
+        Returns:
+            For each query, the top_k passages with their cosine similarity, best first.
+        """
+        count = len(self.passages)
+        if not queries or count == 0:
+            return [[] for _ in queries]
+
+        scores = self.embedder.embed(queries) @ self.embeddings.T
+        k = min(top_k, count)
+        if k < count:
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(count), (len(queries), count))
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind="stable")
+        top = np.take_along_axis(candidates, order, axis=1)
+
+        return [
+            [(self.passages[doc_id], float(scores[row, doc_id])) for doc_id in top[row]]
+            for row in range(len(queries))
+        ]
+
+    def search(self, query: str, top_k: int = 3) -> List[Tuple[Dict[str, str], float]]:
+        """
+        Returns the top_k passages for a single query.
+        """
+        return self.search_batch([query], top_k)[0]
@@ -12,13 +12,145 @@ Date: 2025-09-03
 import logging
 import os
 import json
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Callable
 import re
 
-import google.generativeai as genai
-
 # Use the centralized configuration
-from config import GEMINI_API_KEY, GCP_PROJECT_ID, GCP_REGION
+from config import (
+    GEMINI_API_KEY,
+    GCP_PROJECT_ID,
+    GCP_REGION,
+    GEMINI_BATCH_TOKEN_BUDGET,
+    GEMINI_BATCH_MAX_REQUIREMENTS,
+    GEMINI_CACHE_PATH,
+    GEMINI_CACHE_MAX_BYTES,
+    GEMINI_CACHE_TTL_SECONDS,
+    GEMINI_STREAMING,
+    GEMINI_EXTRACTION_TOKEN_BUDGET,
+    GEMINI_EXTRACTION_OVERLAP_TOKENS
+)
+from credential_errors import is_credentials_error
+from response_cache import ResponseCache
+from json_stream import IncrementalJSONArrayParser
+from lazy_imports import lazy_import
+
+# The Gemini SDK is slow to import; it is loaded when the model is first used.
+genai = lazy_import("google.generativeai")
+
+GEMINI_MODEL_NAME = 'gemini-1.5-flash'
+
+# Bump a template's version whenever its prompt wording changes so stale cached responses are not reused.
+PROMPT_TEMPLATE_VERSIONS = {
+    "parse_requirements": "1",
+    "parse_requirements_chunk": "1",
+    "test_cases": "1",
+    "test_case_batch": "1",
+}
+
+TEST_CASE_SCHEMA = """
+        - "test_case_id" (must be a unique string in the format TC-<requirement_id>-<three_digit_number>, e.g., TC-REQ-001-001)
+        - "title"
+        - "description" (include reference to the compliance standard, e.g., "Verify compliance with FDA 21 CFR 820.30")
+        - "steps" (provide a detailed, step-by-step procedure for execution)
+        - "expected_results" (describe the expected outcome for each step)
+
+"""
+
+
+CHARS_PER_TOKEN = 4
+
+# Page breaks, and the start of markdown ("## Scope") or numbered ("4.2 Alarms") heading lines.
+_SECTION_BOUNDARY = re.compile(r"\f|(?=^(?:#{1,6}\s|\d+(?:\.\d+)*\.?\s+\S))", re.MULTILINE)
+# Progressively finer separators for sections that exceed the chunk budget on their own.
+_FALLBACK_SEPARATORS = ["\n\n", "\n", " "]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimates the number of model tokens in a piece of text (about 4 characters per token).
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _split_oversized(text: str, max_chars: int, separators: List[str]) -> List[str]:
+    """
+    Splits text into pieces of at most max_chars, preferring the coarsest separator that works.
+    """
+    if len(text) <= max_chars:
+        return [text]
+    if not separators:
+        return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+    separator, finer = separators[0], separators[1:]
+    pieces: List[str] = []
+    current = ""
+    for part in text.split(separator):
+        candidate = f"{current}{separator}{part}" if current else part
+        if len(candidate) <= max_chars:
+            current = candidate
+            continue
+        if current:
+            pieces.append(current)
+        if len(part) > max_chars:
+            pieces.extend(_split_oversized(part, max_chars, finer))
+            current = ""
+        else:
+            current = part
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_document(text: str, token_budget: int, overlap_tokens: int = 0) -> List[str]:
+    """
+    Splits a document into chunks of roughly token_budget tokens for separate extraction prompts.
+
+    Chunks break on page ('\\f') and heading boundaries where possible. Each chunk after the
+    first starts with about overlap_tokens of the previous chunk's tail, so a requirement that
+    straddles a boundary is seen whole in at least one chunk.
+
+    Args:
+        text: The full document text.
+        token_budget: Approximate maximum tokens per chunk, including the overlap.
+        overlap_tokens: Approximate tokens repeated from the end of the previous chunk.
+
+    Returns:
+        The chunk texts, in document order.
+    """
+    max_chars = max(1, token_budget * CHARS_PER_TOKEN)
+    overlap_chars = min(max(0, overlap_tokens * CHARS_PER_TOKEN), max_chars // 2)
+    body_chars = max_chars - overlap_chars
+
+    sections: List[str] = []
+    for section in _SECTION_BOUNDARY.split(text):
+        if section.strip():
+            sections.extend(_split_oversized(section, body_chars, _FALLBACK_SEPARATORS))
+
+    bodies: List[str] = []
+    current = ""
+    for section in sections:
+        if current and len(current) + len(section) > body_chars:
+            bodies.append(current)
+            current = ""
+        if current and not current.endswith("\n"):
+            # Keep sections split at a page break on separate lines.
+            current += "\n"
+        current += section
+    if current.strip():
+        bodies.append(current)
+
+    chunks: List[str] = []
+    for i, body in enumerate(bodies):
+        if i and overlap_chars:
+            tail = bodies[i - 1][-overlap_chars:]
+            # Start the overlap on a line boundary when one is available.
+            newline = tail.find("\n")
+            if 0 <= newline < len(tail) - 1:
+                tail = tail[newline + 1:]
+            body = tail + body
+        chunks.append(body)
+    return chunks
 
 
 class GeminiIntegration:
@@ -35,8 +167,34 @@ class GeminiIntegration:
         self.gemini_api_key: str = GEMINI_API_KEY
 
         # Validation is now correctly and centrally handled by config.py
-        genai.configure(api_key=self.gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.model_name: str = GEMINI_MODEL_NAME
+        self._model = None
+        # Set when a request fails on credentials but is answered with fallback data (see credential_errors).
+        self.credentials_error: Optional[Exception] = None
+
+        self.cache: Optional[ResponseCache] = None
+        if GEMINI_CACHE_PATH:
+            try:
+                self.cache = ResponseCache(GEMINI_CACHE_PATH, GEMINI_CACHE_MAX_BYTES, GEMINI_CACHE_TTL_SECONDS)
+            except Exception as e:
+                logging.warning(f"Could not open Gemini response cache at {GEMINI_CACHE_PATH}, continuing without it: {e}")
+
+    @property
+    def model(self):
+        """
+        The Gemini model client, configured and created on first use.
+        """
+        if self._model is None:
+            genai.configure(api_key=self.gemini_api_key)
+            self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def _note_error(self, error: Exception):
+        """
+        Records credential errors that are answered with fallback data instead of raised.
+        """
+        if is_credentials_error(error):
+            self.credentials_error = error
 
     def _validate_config(self):
         """
@@ -47,6 +205,121 @@ class GeminiIntegration:
         # The correct pattern is to use the imported config variables directly.
         pass
 
+    @staticmethod
+    def _clean_gemini_json(response_text: str) -> str:
+        """
+        Strips markdown fences and trailing commas from a Gemini JSON response.
+        """
+        # Clean the response to extract only the JSON part.
+        # Gemini sometimes includes markdown formatting (```json ... ```)
+        cleaned_response = response_text.strip().replace("```json", "").replace("```", "").strip()
+        
+        # Use a more robust method to remove trailing commas from arrays and objects
+        # This handles cases with whitespace or newlines before the closing bracket/brace
+        cleaned_response = re.sub(r",\s*\]", "]", cleaned_response)
+        cleaned_response = re.sub(r",\s*\}", "}", cleaned_response)
+        return cleaned_response
+
+    def _generate_json(self, prompt: str, template: str, strict: bool = False,
+                       on_object: Optional[Callable[[Dict[str, Any]], None]] = None) -> Any:
+        """
+        Sends a prompt to Gemini and parses the JSON reply, consulting the response cache first.
+
+        Only replies that parse as JSON are cached, keyed on the model name, the prompt
+        template version and the full prompt.
+
+        Args:
+            prompt: The full prompt text.
+            template: The PROMPT_TEMPLATE_VERSIONS entry the prompt was built from.
+            strict: Raise json.JSONDecodeError on an unparseable reply instead of returning fallback data.
+            on_object: Called with each object of the reply's JSON array as soon as it is available.
+                With GEMINI_STREAMING enabled this happens while the reply is still being generated.
+
+        Returns:
+            The parsed JSON value.
+        """
+        key = None
+        if self.cache:
+            key = ResponseCache.make_key(self.model_name, template, PROMPT_TEMPLATE_VERSIONS[template], prompt)
+            cached = self.cache.get(key)
+            if cached is not None:
+                logging.info(f"Gemini cache hit for '{template}' prompt.")
+                parsed = json.loads(self._clean_gemini_json(cached))
+                self._notify_objects(parsed, on_object)
+                return parsed
+
+        if GEMINI_STREAMING:
+            return self._generate_json_streamed(prompt, key, strict, on_object)
+
+        response = self.model.generate_content(prompt)
+        parsed = self._parse_reply(response.text, key, strict)
+        self._notify_objects(parsed, on_object)
+        return parsed
+
+    def _generate_json_streamed(self, prompt: str, key: Optional[str], strict: bool,
+                                on_object: Optional[Callable[[Dict[str, Any]], None]]) -> Any:
+        """
+        Streams a Gemini reply through the incremental parser, handing each array object to
+        on_object as soon as its closing brace arrives.
+
+        Replies that are not a bare JSON array fall back to parsing the whole response. If the
+        stream ends before the array closes, the objects recovered so far are returned.
+        """
+        parser = IncrementalJSONArrayParser()
+        chunks: List[str] = []
+        objects: List[Dict[str, Any]] = []
+
+        for chunk in self.model.generate_content(prompt, stream=True):
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks carrying only finish metadata have no text parts.
+                continue
+            chunks.append(text)
+            for obj in parser.feed(text):
+                objects.append(obj)
+                if on_object:
+                    on_object(obj)
+
+        response_text = "".join(chunks)
+        if not parser.started or (not parser.completed and not objects):
+            parsed = self._parse_reply(response_text, key, strict)
+            self._notify_objects(parsed, on_object)
+            return parsed
+
+        logging.info(f"Gemini raw response:\n{response_text}")
+        if not parser.completed:
+            logging.warning(f"Gemini stream ended before the JSON array closed; keeping {len(objects)} complete objects.")
+        elif key and not parser.errors:
+            self.cache.put(key, response_text)
+        return objects
+
+    def _parse_reply(self, response_text: str, key: Optional[str], strict: bool) -> Any:
+        """
+        Parses a complete Gemini reply, caching it if it is valid JSON.
+        """
+        try:
+            parsed = json.loads(self._clean_gemini_json(response_text))
+        except json.JSONDecodeError:
+            if strict:
+                raise
+            return self._parse_gemini_json_response(response_text)
+
+        logging.info(f"Gemini raw response:\n{response_text}")
+        if key:
+            self.cache.put(key, response_text)
+        return parsed
+
+    @staticmethod
+    def _notify_objects(parsed: Any, on_object: Optional[Callable[[Dict[str, Any]], None]]):
+        """
+        Passes each object of an already parsed JSON array to on_object.
+        """
+        if on_object and isinstance(parsed, list):
+            for obj in parsed:
+                if isinstance(obj, dict):
+                    on_object(obj)
+
     def _parse_gemini_json_response(self, response_text: str) -> List[Dict[str, Any]]:
         """
         Cleans and parses a JSON response from the Gemini model.
@@ -58,16 +331,7 @@ class GeminiIntegration:
             A list of dictionaries parsed from the JSON.
         """
         logging.info(f"Gemini raw response:\n{response_text}")
-        
-        # Clean the response to extract only the JSON part.
-        # Gemini sometimes includes markdown formatting (```json ... ```)
-        cleaned_response = response_text.strip().replace("```json", "").replace("```", "").strip()
-        
-        # Use a more robust method to remove trailing commas from arrays and objects
-        # This handles cases with whitespace or newlines before the closing bracket/brace
-        import re
-        cleaned_response = re.sub(r",\s*\]", "]", cleaned_response)
-        cleaned_response = re.sub(r",\s*\}", "}", cleaned_response)
+        cleaned_response = self._clean_gemini_json(response_text)
 
         try:
             return json.loads(cleaned_response)
@@ -83,17 +347,31 @@ class GeminiIntegration:
                 "expected_results": ["A valid JSON response."]
             }]
 
-    def parse_requirements(self, document_text: str) -> List[Dict[str, Any]]:
+    def parse_requirements(self, document_text: str, token_budget: Optional[int] = None,
+                           max_workers: int = 1) -> List[Dict[str, Any]]:
         """
         Parses requirements from a document using Gemini Pro.
 
+        Documents larger than the token budget are split into overlapping chunks on page and
+        heading boundaries. Requirements are extracted from the chunks concurrently, then merged
+        and deduplicated.
+
         Args:
-            document_text: The text of the document to parse.
+            document_text: The text of the document to parse. Pages may be separated by '\\f'.
+            token_budget: Approximate document tokens per extraction prompt. Defaults to
+                GEMINI_EXTRACTION_TOKEN_BUDGET; 0 always sends the whole document in one prompt.
+            max_workers: Number of chunk extraction requests sent concurrently.
 
         Returns:
             A list of dictionaries, where each dictionary represents a requirement.
         """
         logging.info("Parsing requirements with Gemini Pro...")
+        budget = GEMINI_EXTRACTION_TOKEN_BUDGET if token_budget is None else token_budget
+        if budget > 0 and estimate_tokens(document_text) > budget:
+            chunks = split_document(document_text, budget, GEMINI_EXTRACTION_OVERLAP_TOKENS)
+            if len(chunks) > 1:
+                return self._parse_requirements_chunked(chunks, max_workers)
+
         prompt = f"""
         Please parse the following document and extract the requirements.
         Return the output as a JSON array, where each object in the array represents a requirement.
@@ -107,20 +385,112 @@ class GeminiIntegration:
         {document_text}
         """
         try:
-            response = self.model.generate_content(prompt)
-            return self._parse_gemini_json_response(response.text)
+            return self._generate_json(prompt, "parse_requirements")
         except (json.JSONDecodeError, Exception) as e:
+            self._note_error(e)
             logging.error(f"Failed to parse requirements, falling back to demo data. Error: {e}")
-            # Fallback to demo data in case of parsing failure
-            return [{"requirement_id": "REQ-001-DEMO", "title": "Demo Title", "description": "Demo Description", "acceptance_criteria": "Demo Criteria"}]
+            return self._demo_requirements()
+
+    @staticmethod
+    def _demo_requirements() -> List[Dict[str, Any]]:
+        """
+        Fallback demo data used when requirement parsing fails.
+        """
+        return [{"requirement_id": "REQ-001-DEMO", "title": "Demo Title", "description": "Demo Description", "acceptance_criteria": "Demo Criteria"}]
+
+    def _extract_chunk_requirements(self, chunk: str, index: int, total: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Extracts the requirements stated in one chunk of a larger document.
+
+        Returns:
+            The requirements found, or None if the request or its JSON reply failed.
+        """
+        prompt = f"""
+        The following text is part {index + 1} of {total} of a larger document. Its first lines may repeat the end of the previous part.
+        Please extract the requirements stated in this part. Keep each requirement's own ID exactly as written in the document; only invent an ID if the document gives none.
+        Return the output as a JSON array, where each object in the array represents a requirement.
+        Each requirement object should have the following keys:
+        - "requirement_id"
+        - "title"
+        - "description"
+        - "acceptance_criteria"
+
+        Document part:
+        {chunk}
+        """
+        try:
+            parsed = self._generate_json(prompt, "parse_requirements_chunk", strict=True)
+            if not isinstance(parsed, list):
+                raise ValueError("Response is not a JSON array.")
+            return [req for req in parsed if isinstance(req, dict)]
+        except Exception as e:
+            self._note_error(e)
+            logging.error(f"Failed to extract requirements from document part {index + 1} of {total}: {e}")
+            return None
+
+    def _parse_requirements_chunked(self, chunks: List[str], max_workers: int) -> List[Dict[str, Any]]:
+        """
+        Extracts requirements from every chunk concurrently and merges the results.
+        """
+        logging.info(f"Document exceeds the extraction budget; parsing requirements from {len(chunks)} parts...")
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+            results = list(executor.map(
+                lambda item: self._extract_chunk_requirements(item[1], item[0], len(chunks)),
+                enumerate(chunks)
+            ))
+
+        failed = sum(1 for result in results if result is None)
+        if failed == len(chunks):
+            logging.error("Failed to parse requirements from every document part, falling back to demo data.")
+            return self._demo_requirements()
+        if failed:
+            logging.warning(f"Requirements from {failed} of {len(chunks)} document parts are missing.")
+        return self._merge_chunk_requirements(chunks, results)
+
+    @staticmethod
+    def _merge_chunk_requirements(chunks: List[str], results: List[Optional[List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        """
+        Merges per-chunk requirements in document order, dropping duplicates.
 
-    def generate_test_cases_with_compliance(self, requirement: Dict[str, Any], compliance_context: str) -> List[Dict[str, Any]]:
+        A requirement is a duplicate if its title and description match one already kept, or if
+        its ID appears in the document text and was already kept (the same requirement seen in
+        two overlapping chunks). IDs the model invented that collide across chunks are made unique.
+        """
+        def normalize(value: Any) -> str:
+            return " ".join(str(value or "").lower().split())
+
+        merged: List[Dict[str, Any]] = []
+        seen_ids = set()
+        seen_content = set()
+        for index, requirements in enumerate(results):
+            for req in requirements or []:
+                content = (normalize(req.get("title")), normalize(req.get("description")))
+                if content in seen_content:
+                    continue
+                req_id = str(req.get("requirement_id") or "").strip()
+                if req_id in seen_ids:
+                    if req_id in chunks[index]:
+                        continue
+                    req = dict(req, requirement_id=f"{req_id}-P{index + 1}")
+                    req_id = req["requirement_id"]
+                seen_content.add(content)
+                if req_id:
+                    seen_ids.add(req_id)
+                merged.append(req)
+
+        logging.info(f"Merged {sum(len(r or []) for r in results)} extracted requirements into {len(merged)} unique requirements.")
+        return merged
+
+    def generate_test_cases_with_compliance(self, requirement: Dict[str, Any], compliance_context: str,
+                                            on_test_case: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
         """
         Generates test cases for a single requirement using Gemini Pro, with added compliance context.
 
         Args:
             requirement: A dictionary representing a single requirement.
             compliance_context: A string containing relevant compliance information.
+            on_test_case: Called with each test case as soon as it has been generated, fallback
+                test cases included; it sees exactly the test cases returned.
 
         Returns:
             A list of dictionaries, where each dictionary represents a test case.
@@ -131,31 +501,166 @@ class GeminiIntegration:
         Please generate detailed test cases for the following requirement, taking into account the provided compliance context from FDA and ISO regulations.
         The test cases should verify that the requirement is met and that it adheres to the relevant compliance standards.
 
-        Return the output as a JSON array of test case objects. Each object should have the following keys:
-        - "test_case_id" (must be a unique string in the format TC-<requirement_id>-<three_digit_number>, e.g., TC-REQ-001-001)
-        - "title"
-        - "description" (include reference to the compliance standard, e.g., "Verify compliance with FDA 21 CFR 820.30")
-        - "steps" (provide a detailed, step-by-step procedure for execution)
-        - "expected_results" (describe the expected outcome for each step)
-
+        Return the output as a JSON array of test case objects. Each object should have the following keys:{TEST_CASE_SCHEMA}
         Requirement:
-        ID: {requirement.get('requirement_id')}
+{self._format_requirement_block(requirement, compliance_context)}
+        """
+        # Test cases already handed to on_test_case; if the reply fails after some were streamed,
+        # they become the result, so the callback and the returned list never disagree.
+        streamed: List[Dict[str, Any]] = []
+
+        def on_object(test_case: Dict[str, Any]):
+            streamed.append(test_case)
+            if on_test_case:
+                on_test_case(test_case)
+
+        try:
+            return self._generate_json(prompt, "test_cases", on_object=on_object)
+        except json.JSONDecodeError as e:
+            logging.error(f"Error decoding JSON, falling back to demo test case. Error: {e}")
+            fallback = [{"test_case_id": "TC-DEMO-JSON-ERROR", "title": "Demo Test Case (JSON Error)", "description": "Demo Description", "steps": "Demo Steps", "expected_results": "Demo Results"}]
+        except Exception as e:
+            self._note_error(e)
+            logging.error(f"Error generating test cases with Gemini Pro for requirement {requirement.get('requirement_id')}: {e}", exc_info=True)
+            fallback = [{"test_case_id": "TC-DEMO-API-ERROR", "title": "Demo Test Case (API Error)", "description": "Demo Description", "steps": "Demo Steps", "expected_results": "Demo Results"}]
+
+        if streamed:
+            logging.warning(f"Keeping the {len(streamed)} test cases streamed for requirement {requirement.get('requirement_id')} before the error.")
+            return streamed
+        if on_test_case:
+            for test_case in fallback:
+                on_test_case(test_case)
+        return fallback
+
+    @staticmethod
+    def _format_requirement_block(requirement: Dict[str, Any], compliance_context: str) -> str:
+        """
+        Formats one requirement and its compliance context for inclusion in a prompt.
+        """
+        return f"""        ID: {requirement.get('requirement_id')}
         Title: {requirement.get('title')}
         Description: {requirement.get('description')}
         Acceptance Criteria: {requirement.get('acceptance_criteria')}
 
         Compliance Context:
         {compliance_context}
+"""
+
+    def _build_batch_prompt(self, items: List[Tuple[Dict[str, Any], str]]) -> str:
+        """
+        Packs several requirements, each with its own compliance context, into one prompt.
+        The instructions and schema are stated once for the whole batch.
+        """
+        blocks = "\n".join(
+            f"        Requirement {i} of {len(items)}:\n{self._format_requirement_block(req, context)}"
+            for i, (req, context) in enumerate(items, start=1)
+        )
+        return f"""
+        Please generate detailed test cases for each of the following {len(items)} requirements, taking into account the compliance context provided with each requirement from FDA and ISO regulations.
+        The test cases should verify that each requirement is met and that it adheres to the relevant compliance standards.
+
+        Return the output as a single JSON array of test case objects covering all requirements. Each object should have the following keys:
+        - "requirement_id" (the ID of the requirement the test case verifies, copied exactly as given){TEST_CASE_SCHEMA}{blocks}
+        """
+
+    def _pack_batches(self, items: List[Tuple[Dict[str, Any], str]], token_budget: int,
+                      max_requirements: int) -> List[List[Tuple[Dict[str, Any], str]]]:
         """
+        Greedily packs requirements into batches whose estimated prompt size stays within the token budget.
+        A requirement that alone exceeds the budget is placed in a batch of its own.
+        """
+        overhead = estimate_tokens(self._build_batch_prompt([]))
+        batches: List[List[Tuple[Dict[str, Any], str]]] = []
+        current: List[Tuple[Dict[str, Any], str]] = []
+        current_tokens = overhead
+
+        for req, context in items:
+            tokens = estimate_tokens(self._format_requirement_block(req, context))
+            if current and (current_tokens + tokens > token_budget or len(current) >= max_requirements):
+                batches.append(current)
+                current, current_tokens = [], overhead
+            current.append((req, context))
+            current_tokens += tokens
+
+        if current:
+            batches.append(current)
+        return batches
+
+    def _generate_test_case_batch(self, batch: List[Tuple[Dict[str, Any], str]],
+                                  on_test_case: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Sends one packed request and splits the reply into per-requirement test case lists.
+        Requirements that could not be recovered from the reply are retried one at a time.
+
+        A requirement's results are exactly the test cases passed to on_test_case for it: those
+        streamed before a failed reply are kept, and only requirements with none are retried.
+        Results are keyed by requirement ID as a string, since extracted IDs and the IDs the
+        model echoes back may be numbers.
+        """
+        if len(batch) == 1:
+            req, context = batch[0]
+            return {str(req["requirement_id"]): self.generate_test_cases_with_compliance(req, context, on_test_case)}
+
+        batch_ids = [str(req["requirement_id"]) for req, _ in batch]
+        logging.info(f"Generating test cases for {len(batch)} requirements in one request: {', '.join(batch_ids)}")
+        results: Dict[str, List[Dict[str, Any]]] = {}
+
+        def on_object(test_case: Dict[str, Any]):
+            # Every array object of the reply passes through here, streamed or not.
+            req_id = test_case.get("requirement_id")
+            req_id = None if req_id is None else str(req_id)
+            if req_id not in batch_ids:
+                logging.warning(f"Dropping batch test case with unknown requirement_id: {req_id}")
+                return
+            results.setdefault(req_id, []).append(test_case)
+            if on_test_case:
+                on_test_case(test_case)
+
         try:
-            response = self.model.generate_content(prompt)
-            return self._parse_gemini_json_response(response.text)
-        except json.JSONDecodeError as e:
-            logging.error(f"Error decoding JSON, falling back to demo test case. Error: {e}")
-            return [{"test_case_id": "TC-DEMO-JSON-ERROR", "title": "Demo Test Case (JSON Error)", "description": "Demo Description", "steps": "Demo Steps", "expected_results": "Demo Results"}]
+            parsed = self._generate_json(self._build_batch_prompt(batch), "test_case_batch", strict=True, on_object=on_object)
+            if not isinstance(parsed, list):
+                raise ValueError("Batch response is not a JSON array.")
         except Exception as e:
-            logging.error(f"Error generating test cases with Gemini Pro for requirement {requirement.get('requirement_id')}: {e}", exc_info=True)
-            return [{"test_case_id": "TC-DEMO-API-ERROR", "title": "Demo Test Case (API Error)", "description": "Demo Description", "steps": "Demo Steps", "expected_results": "Demo Results"}]
+            self._note_error(e)
+            logging.error(f"Batch test case generation failed for {', '.join(batch_ids)}: {e}")
+
+        for req_id, (req, context) in zip(batch_ids, batch):
+            if req_id not in results:
+                logging.info(f"Retrying requirement {req_id} individually...")
+                results[req_id] = self.generate_test_cases_with_compliance(req, context, on_test_case)
+        return results
+
+    def generate_test_cases_batch(self, items: List[Tuple[Dict[str, Any], str]],
+                                  token_budget: Optional[int] = None,
+                                  max_requirements: Optional[int] = None,
+                                  max_workers: int = 1,
+                                  on_test_case: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Generates test cases for many requirements, packing several into each Gemini request.
+
+        Args:
+            items: (requirement, compliance_context) pairs. Requirement IDs must be unique as strings.
+            token_budget: Approximate prompt token budget per request. Defaults to GEMINI_BATCH_TOKEN_BUDGET.
+            max_requirements: Maximum requirements per request. Defaults to GEMINI_BATCH_MAX_REQUIREMENTS.
+            max_workers: Number of packed requests sent concurrently.
+            on_test_case: Called with each test case as soon as it has been generated. It may be
+                called from several worker threads at once.
+
+        Returns:
+            A dictionary mapping each requirement_id, as a string, to its list of test cases.
+        """
+        batches = self._pack_batches(
+            items,
+            token_budget or GEMINI_BATCH_TOKEN_BUDGET,
+            max(1, max_requirements or GEMINI_BATCH_MAX_REQUIREMENTS)
+        )
+        logging.info(f"Packed {len(items)} requirements into {len(batches)} test case generation requests.")
+
+        results: Dict[str, List[Dict[str, Any]]] = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches) or 1))) as executor:
+            for batch_results in executor.map(lambda batch: self._generate_test_case_batch(batch, on_test_case), batches):
+                results.update(batch_results)
+        return results
 
 
 def main():
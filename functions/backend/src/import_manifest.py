@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Import Manifest for Incremental Vertex AI Search Imports.
+
+The manifest records which GCS documents have been imported into a data store,
+with the object generation and MD5 each was imported at. It is stored as a JSON
+object in the same bucket as the documents. Diffing the current objects against
+it tells import_compliance_documents exactly which documents to import and which
+to purge, so a one-file knowledge base edit re-indexes one document.
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import json
+import logging
+from typing import List, Dict, Any, Tuple
+
+MANIFEST_BLOB_NAME = ".healthguard/import_manifest.json"
+
+
+def load_manifest(bucket, data_store_name: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Returns the documents previously imported into data_store_name, keyed by GCS URI.
+    A missing, unreadable or other-data-store manifest counts as empty.
+    """
+    blob = bucket.get_blob(MANIFEST_BLOB_NAME)
+    if blob is None:
+        return {}
+    try:
+        manifest = json.loads(blob.download_as_bytes())
+    except ValueError as e:
+        logging.warning(f"Ignoring unreadable import manifest gs://{bucket.name}/{MANIFEST_BLOB_NAME}: {e}")
+        return {}
+    if manifest.get("data_store") != data_store_name:
+        logging.info("Import manifest belongs to another data store; importing everything.")
+        return {}
+    return manifest.get("documents", {})
+
+
+def save_manifest(bucket, data_store_name: str, documents: Dict[str, Dict[str, Any]]):
+    """
+    Replaces the manifest with the given documents.
+    """
+    payload = json.dumps({"data_store": data_store_name, "documents": documents}, indent=2, sort_keys=True)
+    bucket.blob(MANIFEST_BLOB_NAME).upload_from_string(payload, content_type="application/json")
+
+
+def diff_manifest(previous: Dict[str, Dict[str, Any]],
+                  current: Dict[str, Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+    """
+    Compares the current documents with the manifest.
+
+    Args:
+        previous: The manifest's documents, keyed by URI.
+        current: The documents now in the bucket, keyed by URI, with "generation" and "md5_hash".
+
+    Returns:
+        (URIs to import because they are new or changed, URIs to purge because they were deleted)
+    """
+    changed = [
+        uri for uri, entry in sorted(current.items())
+        if previous.get(uri, {}).get("generation") != entry.get("generation")
+        or previous.get(uri, {}).get("md5_hash") != entry.get("md5_hash")
+    ]
+    deleted = sorted(uri for uri in previous if uri not in current)
+    return changed, deleted
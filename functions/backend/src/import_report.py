@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Import-Time Report for HealthGuard AI Entry Points.
+
+Runs 'python -X importtime -c "import <module>"' in a fresh interpreter for each
+entry point and summarizes the result: the total import time and the slowest
+of the module's direct imports by cumulative time. Use it to check that cold
+starts of the CLI, the pipeline worker and the Cloud Function stay fast, e.g.:
+
+    python import_report.py main_pipeline pipeline_worker
+    python import_report.py --top 15 gemini_integration
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import List, Dict, Any, Tuple
+
+# "import time:   self [us] | cumulative | imported package" lines written by -X importtime.
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+DEFAULT_MODULES = ["main_pipeline", "pipeline_worker"]
+
+
+def measure_import(module: str, cwd: str = None) -> Dict[str, Any]:
+    """
+    Imports module in a fresh interpreter with -X importtime and parses the timings.
+
+    Args:
+        module: The module to import.
+        cwd: Directory to run the interpreter in (defaults to this file's directory).
+
+    Returns:
+        A dictionary with the module's "total_ms", the "packages" it imports directly as
+        (name, cumulative ms) pairs sorted slowest first, and any import "error".
+    """
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, capture_output=True, text=True
+    )
+
+    packages: List[Tuple[str, float]] = []
+    pending: List[Tuple[str, float]] = []
+    total_us = 0
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        # Nested imports are printed before their parent, two spaces deeper per level.
+        depth = (len(indent) + 1) // 2
+        if depth == 2:
+            pending.append((name, int(cumulative) / 1000))
+        elif depth == 1:
+            if name == module:
+                packages, total_us = pending, int(cumulative)
+            pending = []
+
+    error = None
+    if result.returncode != 0:
+        error = (result.stderr.strip().splitlines() or ["unknown error"])[-1]
+    return {
+        "module": module,
+        "total_ms": total_us / 1000,
+        "packages": sorted(packages, key=lambda item: -item[1]),
+        "error": error,
+    }
+
+
+def format_report(reports: List[Dict[str, Any]], top: int = 10) -> str:
+    """
+    Formats import measurements as a plain-text summary.
+    """
+    lines = []
+    for report in reports:
+        lines.append(f"{report['module']}: {report['total_ms']:.1f} ms")
+        if report["error"]:
+            lines.append(f"  import failed: {report['error']}")
+        for name, milliseconds in report["packages"][:top]:
+            lines.append(f"  {milliseconds:9.1f} ms  {name}")
+    return "\n".join(lines)
+
+
+def main():
+    """
+    Prints an import-time report for the given modules (the CLI and worker by default).
+    """
+    parser = argparse.ArgumentParser(description="Summarize cold-start import times of HealthGuard entry points.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="Modules to import.")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list per module.")
+    args = parser.parse_args()
+
+    reports = [measure_import(module) for module in args.modules]
+    print(format_report(reports, args.top))
+    sys.exit(1 if any(report["error"] for report in reports) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental JSON Array Parser for streamed Gemini responses.
+
+Gemini replies with a JSON array of objects (requirements or test cases),
+sometimes wrapped in markdown fences. When the reply is streamed, this parser
+consumes it chunk by chunk and returns each top-level object as soon as its
+closing brace arrives, so callers can act on the first result without waiting
+for the whole response.
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import json
+import logging
+import re
+from typing import Any, Dict, Iterable, Iterator, List
+
+# Characters that can change the parser state; everything else is copied through.
+_STRUCTURAL_CHARS = re.compile(r'[\[\]{}"\\]')
+_TRAILING_COMMA = re.compile(r",\s*([\]}])")
+
+
+class IncrementalJSONArrayParser:
+    """
+    Extracts the objects of a top-level JSON array from a stream of text chunks.
+
+    Text before the opening '[' (such as a ```json fence) is ignored, as is
+    anything after the closing ']'. Non-object array elements are skipped. If a
+    structural character other than '[' appears first, the reply is not a JSON
+    array: the parser stops with started left False.
+    """
+
+    def __init__(self):
+        self.started: bool = False
+        self.completed: bool = False
+        self.errors: int = 0
+        self._depth: int = 0
+        self._in_string: bool = False
+        self._escape_pending: bool = False
+        self._capturing: bool = False
+        self._pending: List[str] = []
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Consumes the next chunk of the response.
+
+        Args:
+            chunk: The next piece of response text.
+
+        Returns:
+            The objects completed by this chunk, in order.
+        """
+        objects: List[Dict[str, Any]] = []
+        if self.completed or not chunk:
+            return objects
+
+        pos = 0
+        capture_start = 0
+        if self._escape_pending:
+            # The previous chunk ended on a backslash inside a string; skip the escaped character.
+            self._escape_pending = False
+            pos = 1
+
+        while True:
+            match = _STRUCTURAL_CHARS.search(chunk, pos)
+            if match is None:
+                break
+            char = match.group()
+            pos = match.end()
+
+            if self._in_string:
+                if char == "\\":
+                    if pos >= len(chunk):
+                        self._escape_pending = True
+                    pos += 1
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if not self.started:
+                if char == "[":
+                    self.started = True
+                    self._depth = 1
+                else:
+                    # The reply is not a bare JSON array; leave it to a whole-response parse.
+                    self.completed = True
+                    break
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "[{":
+                if self._depth == 1 and char == "{":
+                    self._capturing = True
+                    capture_start = match.start()
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 1 and char == "}" and self._capturing:
+                    self._pending.append(chunk[capture_start:pos])
+                    self._emit(objects)
+                elif self._depth == 0:
+                    self.completed = True
+                    break
+
+        if self._capturing:
+            self._pending.append(chunk[capture_start:])
+        return objects
+
+    def _emit(self, objects: List[Dict[str, Any]]):
+        """
+        Parses the captured text of one complete object and appends it to objects.
+        """
+        text = _TRAILING_COMMA.sub(r"\1", "".join(self._pending))
+        self._pending = []
+        self._capturing = False
+        try:
+            objects.append(json.loads(text))
+        except json.JSONDecodeError as e:
+            self.errors += 1
+            logging.error(f"Skipping unparseable object in streamed JSON array: {e}")
+
+
+def iter_json_array_objects(chunks: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Yields each object of a JSON array as soon as it is complete in the chunk stream.
+    """
+    parser = IncrementalJSONArrayParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+        if parser.completed:
+            break
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Lazy Module Imports for HealthGuard AI.
+
+The Google Cloud and Gemini client libraries take seconds to import, yet many
+entry points (the CLI thin client, the local search backends, setup scripts
+that only touch one service) never use most of them. lazy_import returns a
+placeholder that performs the real import on first attribute access, so a
+module can keep its imports at the top while only paying for what it uses.
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import importlib
+import threading
+from types import ModuleType
+from typing import Optional
+
+
+class LazyModule(ModuleType):
+    """
+    A stand-in for a module that is imported on first attribute access.
+    The import is guarded by a lock, so concurrent first uses from worker threads are safe.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        module: Optional[ModuleType] = self.__dict__["_lazy_module"]
+        if module is None:
+            with self.__dict__["_lazy_lock"]:
+                module = self.__dict__["_lazy_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__dict__["_lazy_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Returns a module that is imported the first time one of its attributes is used.
+
+    Args:
+        name: The absolute module name, e.g. "google.cloud.storage".
+    """
+    return LazyModule(name)
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Local BM25 Search over the Compliance Knowledge Base.
+
+The compliance corpus in 'compliance-knowledge-base/' is small enough to index
+in process. This module splits its text files, PDFs and JSON metadata into
+passages, builds an inverted index scored with Okapi BM25 and persists it to
+disk. The index is rebuilt automatically when any corpus file changes. It lets
+the pipeline search compliance standards without a Vertex AI Search round trip.
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+
+INDEX_FORMAT_VERSION = 1
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or shall that the their this "
+    "to was were which will with".split()
+)
+_SNIPPET_CHARS = 400
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercases text and splits it into index terms, keeping clause numbers such as '820.30' whole.
+    """
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def _read_text_passages(path: str) -> List[Dict[str, str]]:
+    """
+    Splits a plain-text standard into one passage per blank-line separated block.
+    A leading 'Title:' line names the document; each block's first line is its heading.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        blocks = [block.strip() for block in re.split(r"\n\s*\n", f.read()) if block.strip()]
+
+    document_title = os.path.splitext(os.path.basename(path))[0]
+    if blocks and blocks[0].lower().startswith("title:"):
+        document_title = blocks.pop(0).split(":", 1)[1].strip()
+
+    passages = []
+    for block in blocks:
+        heading, _, body = block.partition("\n")
+        passages.append({
+            "title": f"{document_title} - {heading.strip()}" if body else document_title,
+            "text": block,
+        })
+    return passages
+
+
+def _read_pdf_passages(path: str) -> List[Dict[str, str]]:
+    """
+    Extracts one passage per page of a PDF. Unreadable PDFs yield no passages.
+    """
+    try:
+        from pypdf import PdfReader
+        reader = PdfReader(path)
+        pages = [page.extract_text() or "" for page in reader.pages]
+    except Exception as e:
+        logging.warning(f"Skipping PDF that could not be read for the local index: {path} ({e})")
+        return []
+
+    title = os.path.splitext(os.path.basename(path))[0]
+    return [
+        {"title": f"{title} (page {number})", "text": text.strip()}
+        for number, text in enumerate(pages, start=1) if text.strip()
+    ]
+
+
+def _read_metadata(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Loads the JSON metadata that describes a PDF of the same name.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning(f"Skipping unreadable metadata file {path}: {e}")
+        return None
+
+
+def corpus_fingerprint(root: str) -> str:
+    """
+    Summarizes the paths, sizes and modification times of every indexable file under root.
+    """
+    entries = []
+    for directory, _, files in os.walk(root):
+        for name in sorted(files):
+            if name.lower().endswith((".txt", ".md", ".pdf", ".json")):
+                stat = os.stat(os.path.join(directory, name))
+                entries.append(f"{os.path.relpath(os.path.join(directory, name), root)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return f"v{INDEX_FORMAT_VERSION}|" + "|".join(sorted(entries))
+
+
+def read_corpus_passages(root: str) -> List[Dict[str, str]]:
+    """
+    Reads every text, PDF and JSON metadata file under root and splits it into passages.
+
+    Each passage has a "title", a "source" path relative to root, the display "text" and the
+    "index_text" to search on. Metadata fields (title, regulation code, summary, keywords) are
+    added to the passages of the PDF with the same name, or become a passage of their own when
+    the PDF has no text.
+    """
+    corpus: List[Dict[str, str]] = []
+    for directory, _, files in os.walk(root):
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            stem, extension = os.path.splitext(name)
+            extension = extension.lower()
+            source = os.path.relpath(path, root).replace(os.sep, "/")
+
+            if extension in (".txt", ".md"):
+                passages = _read_text_passages(path)
+            elif extension == ".pdf":
+                passages = _read_pdf_passages(path)
+                metadata_path = os.path.join(directory, f"{stem}.json")
+                metadata = _read_metadata(metadata_path) if os.path.exists(metadata_path) else None
+                if metadata:
+                    metadata_text = " ".join(
+                        str(metadata.get(field, "")) for field in ("document_title", "regulation_code", "clause_summary")
+                    ) + " " + " ".join(map(str, metadata.get("keywords", [])))
+                    title = f"{metadata.get('regulation_code', '')} {metadata.get('document_title', stem)}".strip()
+                    if passages:
+                        for passage in passages:
+                            passage["title"] = title
+                            passage["index_text"] = f"{metadata_text}\n{passage['text']}"
+                    else:
+                        passages = [{"title": title, "text": metadata_text.strip()}]
+            else:
+                continue
+
+            for passage in passages:
+                passage["source"] = source
+                passage.setdefault("index_text", passage["text"])
+                corpus.append(passage)
+    return corpus
+
+
+class LocalComplianceIndex:
+    """
+    An Okapi BM25 inverted index over passages of the compliance knowledge base.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1: float = k1
+        self.b: float = b
+        self.passages: List[Dict[str, str]] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.lengths: List[int] = []
+        self.average_length: float = 0.0
+        self.fingerprint: str = ""
+
+    @classmethod
+    def build(cls, root: str) -> "LocalComplianceIndex":
+        """
+        Indexes every passage of the compliance knowledge base under root.
+        """
+        index = cls()
+        for passage in read_corpus_passages(root):
+            index._add(passage)
+        index._finish()
+        index.fingerprint = corpus_fingerprint(root)
+        logging.info(f"Built local compliance index with {len(index.passages)} passages from {root}")
+        return index
+
+    def _add(self, passage: Dict[str, str]):
+        """
+        Adds one passage to the inverted index.
+        """
+        doc_id = len(self.passages)
+        terms = tokenize(f"{passage['title']}\n{passage.pop('index_text')}")
+        for term, frequency in Counter(terms).items():
+            self.postings.setdefault(term, []).append((doc_id, frequency))
+        self.passages.append(passage)
+        self.lengths.append(len(terms))
+
+    def _finish(self):
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def search(self, query: str, top_k: int = 3) -> List[Tuple[Dict[str, str], float]]:
+        """
+        Returns the top_k passages for query with their BM25 scores, best first.
+        """
+        total = len(self.passages)
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / (self.average_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        return [(self.passages[doc_id], score) for doc_id, score in best]
+
+    def save(self, path: str):
+        """
+        Writes the index to a JSON file, replacing it atomically.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        data = {
+            "fingerprint": self.fingerprint,
+            "k1": self.k1,
+            "b": self.b,
+            "passages": self.passages,
+            "postings": self.postings,
+            "lengths": self.lengths,
+        }
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, delete=False, suffix=".tmp") as f:
+            json.dump(data, f)
+        os.replace(f.name, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalComplianceIndex":
+        """
+        Reads an index written by save().
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(data["k1"], data["b"])
+        index.fingerprint = data["fingerprint"]
+        index.passages = data["passages"]
+        index.postings = {term: [tuple(posting) for posting in postings] for term, postings in data["postings"].items()}
+        index.lengths = data["lengths"]
+        index._finish()
+        return index
+
+    @classmethod
+    def load_or_build(cls, root: str, index_path: Optional[str] = None) -> "LocalComplianceIndex":
+        """
+        Loads the persisted index if it matches the current corpus, otherwise rebuilds and saves it.
+
+        Args:
+            root: The compliance knowledge base directory.
+            index_path: Where the index is persisted. None keeps it in memory only.
+        """
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"Compliance knowledge base not found at: {root}")
+
+        if index_path and os.path.exists(index_path):
+            try:
+                index = cls.load(index_path)
+                if index.fingerprint == corpus_fingerprint(root):
+                    return index
+                logging.info("Compliance knowledge base changed; rebuilding the local index.")
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Could not load local compliance index from {index_path}, rebuilding: {e}")
+
+        index = cls.build(root)
+        if index_path:
+            try:
+                index.save(index_path)
+            except OSError as e:
+                logging.warning(f"Could not save local compliance index to {index_path}: {e}")
+        return index
+
+    @staticmethod
+    def snippet(passage: Dict[str, str]) -> str:
+        """
+        Returns a short, single-line excerpt of a passage for a prompt.
+        """
+        text = " ".join(passage["text"].split())
+        return text if len(text) <= _SNIPPET_CHARS else text[:_SNIPPET_CHARS].rsplit(" ", 1)[0] + "..."
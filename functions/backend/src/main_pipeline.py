@@ -9,23 +9,39 @@ Author: Gemini
 Date: 2025-09-03
 """
 
+import json
 import logging
 import os
-import json
 import sys
-import tempfile
-import uuid # <-- Add this import
-from typing import List, Dict, Any
-
-from pypdf import PdfReader
-from google.cloud import storage  # <-- I am adding this line back
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Dict, Any, Optional, Callable, BinaryIO, Set
 
 # Use the centralized configuration and logging
-from config import logging, SAMPLE_DOC_PATH
+from config import (
+    logging, SAMPLE_DOC_PATH, PIPELINE_MAX_WORKERS, GEMINI_BATCH_TOKEN_BUDGET, GCS_STREAM_THRESHOLD_BYTES,
+    PDF_EXTRACT_WORKERS, PDF_PARALLEL_MIN_PAGES, PIPELINE_HISTORY_PATH, PIPELINE_HISTORY_MAX_BYTES,
+    PIPELINE_OUTPUT_FORMAT, PIPELINE_OUTPUT_GZIP, PIPELINE_WORKER_URL
+)
+from lazy_imports import lazy_import
 from setup_day1 import HealthcareQASetup
-from setup_day2 import VertexAISearchSetup
-from gemini_integration import GeminiIntegration
+from setup_day2 import VertexAISearchSetup, SEARCH_ERROR_CONTEXT
+from gemini_integration import GeminiIntegration, PROMPT_TEMPLATE_VERSIONS
 from healthcare_pipeline import process_document_for_compliance
+from pdf_extract import iter_pdf_pages
+from result_output import ResultWriter, dumps
+from run_history import RunHistory, open_run_history, requirement_fingerprint
+
+# Heavy third-party modules are loaded on first use to keep cold starts fast.
+storage = lazy_import("google.cloud.storage")
+
+
+def _open_gcs_object(bucket_name: str, blob_name: str) -> BinaryIO:
+    """
+    Opens a GCS object as a seekable stream; used by PDF extraction worker processes.
+    """
+    return storage.Client().bucket(bucket_name).blob(blob_name).open("rb")
 
 
 class RAGPipeline:
@@ -33,77 +49,299 @@ class RAGPipeline:
     A class to orchestrate the RAG pipeline.
     """
 
-    def __init__(self):
+    def __init__(self, max_workers: Optional[int] = None):
         """
         Initializes the RAG pipeline, setting up clients.
+
+        Args:
+            max_workers: Maximum number of requirements processed concurrently.
+                Defaults to PIPELINE_MAX_WORKERS; 1 runs requirements sequentially.
         """
-        self.day1_setup = HealthcareQASetup()
+        self._day1_setup: Optional[HealthcareQASetup] = None
         self.day2_setup = VertexAISearchSetup()
         self.gemini = GeminiIntegration()
+        self.max_workers: int = max(1, max_workers or PIPELINE_MAX_WORKERS)
+        self._storage_client = None
+        self.history: Optional[RunHistory] = open_run_history(
+            PIPELINE_HISTORY_PATH, PIPELINE_HISTORY_MAX_BYTES,
+            json.dumps({"model": self.gemini.model_name, "templates": PROMPT_TEMPLATE_VERSIONS}, sort_keys=True)
+        )
+
+    @property
+    def credentials_error(self) -> Optional[Exception]:
+        """
+        A credentials error that search or Gemini answered with fallback results, if any. Such a
+        pipeline's clients should be rebuilt before it is used again.
+        """
+        return self.day2_setup.credentials_error or self.gemini.credentials_error
+
+    @property
+    def day1_setup(self) -> HealthcareQASetup:
+        """
+        The Document AI setup, created on first use (the pipeline itself does not need it).
+        """
+        if self._day1_setup is None:
+            self._day1_setup = HealthcareQASetup()
+        return self._day1_setup
+
+    def _map(self, func: Callable[[Any], Any], items: List[Any]) -> List[Any]:
+        """
+        Applies func to every item on a bounded thread pool (the work is network-bound).
+        Results are returned in the same order as the input items.
+        """
+        workers = min(self.max_workers, len(items))
+        if workers <= 1:
+            return [func(item) for item in items]
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="requirement") as executor:
+            return list(executor.map(func, items))
+
+    def _search_requirement(self, req: Dict[str, Any]) -> str:
+        """
+        Finds relevant compliance information for a single requirement.
+        """
+        logging.info(f"Processing requirement: {req.get('requirement_id')}")
+        query = f"{req.get('title')} {req.get('description')}"
+        return self.day2_setup.search_compliance_knowledge_base(query)
+
+    def _process_requirement(self, req: Dict[str, Any],
+                             on_test_case: Optional[Callable[[Dict[str, Any]], None]] = None,
+                             on_search_error: Optional[Callable[[], None]] = None) -> List[Dict[str, Any]]:
+        """
+        Searches the compliance knowledge base and generates test cases for one requirement.
+
+        Args:
+            req: A dictionary representing a single requirement.
+            on_test_case: Called with each test case as soon as it has been generated.
+            on_search_error: Called if the search failed and the test cases are generated
+                without compliance context.
+
+        Returns:
+            A list of test case dictionaries for the requirement.
+        """
+        compliance_context = self._search_requirement(req)
+        if compliance_context == SEARCH_ERROR_CONTEXT and on_search_error:
+            on_search_error()
+        return self.gemini.generate_test_cases_with_compliance(req, compliance_context, on_test_case)
+
+    def _process_requirements(self, requirements: List[Dict[str, Any]],
+                              on_test_case: Optional[Callable[[Dict[str, Any]], None]] = None,
+                              search_errors: Optional[Set[int]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Runs search and test case generation for many requirements at once.
+
+        When GEMINI_BATCH_TOKEN_BUDGET is set, requirements with unique IDs are packed several
+        to a Gemini request; the rest are generated one request per requirement.
+
+        Args:
+            requirements: The parsed requirements.
+            on_test_case: Called with each test case as soon as it has been generated, in
+                completion order. Calls are serialized, so it need not be thread-safe.
+            search_errors: If given, receives the indices of the requirements whose compliance
+                search failed; their test cases were generated without compliance context.
+
+        Returns:
+            One list of test cases per requirement, in requirement order.
+        """
+        if on_test_case:
+            lock = threading.Lock()
+            notify = on_test_case
+
+            def on_test_case(test_case: Dict[str, Any]):
+                with lock:
+                    notify(test_case)
+
+        if len(requirements) > 1:
+            logging.info(f"Processing {len(requirements)} requirements with up to {self.max_workers} concurrent workers...")
+        if search_errors is None:
+            search_errors = set()
+        if GEMINI_BATCH_TOKEN_BUDGET <= 0 or len(requirements) <= 1:
+            return self._map(
+                lambda index: self._process_requirement(requirements[index], on_test_case,
+                                                        lambda: search_errors.add(index)),
+                list(range(len(requirements)))
+            )
+
+        contexts = self.day2_setup.search_compliance_knowledge_base_batch(
+            [f"{req.get('title')} {req.get('description')}" for req in requirements],
+            max_workers=self.max_workers
+        )
+        search_errors.update(i for i, context in enumerate(contexts) if context == SEARCH_ERROR_CONTEXT)
+
+        # Extracted IDs may be numbers; batch results are keyed by the ID as a string.
+        ids = [str(req.get("requirement_id")) if req.get("requirement_id") not in (None, "") else None for req in requirements]
+        id_counts: Dict[Optional[str], int] = {}
+        for req_id in ids:
+            id_counts[req_id] = id_counts.get(req_id, 0) + 1
+        batchable = [
+            (req, context) for req_id, req, context in zip(ids, requirements, contexts)
+            if req_id is not None and id_counts[req_id] == 1
+        ]
+        batch_results = self.gemini.generate_test_cases_batch(batchable, max_workers=self.max_workers,
+                                                              on_test_case=on_test_case)
+
+        def generate(index: int) -> List[Dict[str, Any]]:
+            req, req_id = requirements[index], ids[index]
+            if req_id is not None and id_counts[req_id] == 1 and req_id in batch_results:
+                return batch_results[req_id]
+            return self.gemini.generate_test_cases_with_compliance(req, contexts[index], on_test_case)
+
+        return self._map(generate, list(range(len(requirements))))
+
+    @property
+    def storage_client(self):
+        """
+        The Cloud Storage client, created on first use and reused across runs.
+        """
+        if self._storage_client is None:
+            self._storage_client = storage.Client()
+        return self._storage_client
+
+    def _read_document(self, gcs_uri: str) -> str:
+        """
+        Reads the text of a PDF, .txt or .md document straight from GCS, without temporary files.
+
+        Documents up to GCS_STREAM_THRESHOLD_BYTES are downloaded into memory; larger ones are
+        read through a chunked, seekable blob stream.
+
+        Args:
+            gcs_uri: The GCS URI of the document.
 
-    def run_pipeline(self, gcs_uri: str) -> List[Dict[str, Any]]:
+        Returns:
+            The document text. PDF pages are separated by form feeds.
+        """
+        if not gcs_uri.startswith("gs://"):
+            raise ValueError("Invalid GCS URI. Must start with 'gs://'")
+        bucket_name, blob_name = gcs_uri[5:].split("/", 1)
+        extension = os.path.splitext(blob_name)[1].lower()
+        if extension not in (".pdf", ".txt", ".md"):
+            raise ValueError(f"Unsupported file type: {blob_name}")
+
+        blob = self.storage_client.bucket(bucket_name).get_blob(blob_name)
+        if blob is None:
+            raise FileNotFoundError(f"Document not found: {gcs_uri}")
+
+        streamed = blob.size is not None and blob.size > GCS_STREAM_THRESHOLD_BYTES
+        logging.info(f"{'Streaming' if streamed else 'Downloading'} document from: {gcs_uri} ({blob.size} bytes)")
+        if extension == ".pdf":
+            # Form feeds mark page boundaries for chunked requirement extraction.
+            if streamed:
+                # Each extraction worker streams its own page ranges from GCS.
+                with blob.open("rb") as stream:
+                    return "\f".join(iter_pdf_pages(
+                        stream, PDF_EXTRACT_WORKERS or None, PDF_PARALLEL_MIN_PAGES,
+                        open_stream=partial(_open_gcs_object, bucket_name, blob_name)
+                    ))
+            return "\f".join(iter_pdf_pages(blob.download_as_bytes(), PDF_EXTRACT_WORKERS or None, PDF_PARALLEL_MIN_PAGES))
+
+        if streamed:
+            with blob.open("rt", encoding="utf-8") as stream:
+                return stream.read()
+        return blob.download_as_bytes().decode("utf-8")
+
+    def _generate_incrementally(self, document_key: str, requirements: List[Dict[str, Any]],
+                                on_test_case: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Generates test cases only for requirements that are new or changed since the document's
+        previous run; unchanged requirements reuse their previous test cases.
+
+        Args:
+            document_key: Identifies the document across revisions.
+            requirements: The requirements of the current revision.
+            on_test_case: Called with each test case, reused or newly generated.
+
+        Returns:
+            One list of test cases per requirement, in requirement order.
+        """
+        if not self.history:
+            return self._process_requirements(requirements, on_test_case)
+
+        previous = self.history.load(document_key)
+        fingerprints = [requirement_fingerprint(req) for req in requirements]
+        changed = [i for i, fingerprint in enumerate(fingerprints) if fingerprint not in previous]
+        logging.info(
+            f"Reusing test cases for {len(requirements) - len(changed)} unchanged requirements; "
+            f"processing {len(changed)} new or changed requirements."
+        )
+
+        results: List[List[Dict[str, Any]]] = [previous.get(fingerprint, []) for fingerprint in fingerprints]
+        if on_test_case:
+            changed_set = set(changed)
+            for i, test_cases in enumerate(results):
+                if i not in changed_set:
+                    for test_case in test_cases:
+                        on_test_case(test_case)
+
+        search_errors: Set[int] = set()
+        generated = self._process_requirements([requirements[i] for i in changed], on_test_case, search_errors)
+        for i, test_cases in zip(changed, generated):
+            results[i] = test_cases
+
+        if self.credentials_error:
+            # Results from a run whose credentials failed are not kept; the caller may retry
+            # with fresh clients, and that retry must regenerate them.
+            logging.warning("Not saving run history after a credentials error.")
+            return results
+
+        # Test cases generated without compliance context are regenerated on the next run.
+        unreliable = {changed[i] for i in search_errors}
+        self.history.save(document_key, {
+            fingerprint: test_cases
+            for i, (fingerprint, test_cases) in enumerate(zip(fingerprints, results)) if i not in unreliable
+        })
+        return results
+
+    def run_pipeline(self, gcs_uri: str,
+                     on_test_case: Optional[Callable[[Dict[str, Any]], None]] = None,
+                     document_key: Optional[str] = None,
+                     on_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
         """
         Runs the end-to-end RAG pipeline.
 
+        Requirements unchanged since the previous run of the same document reuse that run's
+        test cases (see PIPELINE_HISTORY_PATH); the compliance analysis always covers the full set.
+
         Args:
             gcs_uri: The GCS URI of the document to process.
+            on_test_case: Called with each test case as soon as it has been generated, before
+                the compliance analysis runs. Calls are serialized.
+            document_key: Identifies revisions of the same document. Defaults to gcs_uri.
+            on_progress: Called with a stage name and details as each stage of the run starts or ends.
 
         Returns:
             A list of dictionaries, where each dictionary represents a test case.
         """
         logging.info("--- Starting RAG Pipeline ---")
-        document_path = None  # Initialize to ensure it exists in the finally block
+        progress = on_progress or (lambda stage, details: None)
 
         try:
             # 1. Download the document from GCS and read the text
-            logging.info(f"Downloading document from: {gcs_uri}")
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.basename(gcs_uri)) as temp_file:
-                storage_client = storage.Client()
-                if not gcs_uri.startswith("gs://"):
-                    raise ValueError("Invalid GCS URI. Must start with 'gs://'")
-                bucket_name, blob_name = gcs_uri[5:].split("/", 1)
-                bucket = storage_client.bucket(bucket_name)
-                blob = bucket.blob(blob_name)
-                blob.download_to_filename(temp_file.name)
-                document_path = temp_file.name
-
-            logging.info(f"Reading text from temporary file: {document_path}")
-            document_text = ""
-            if document_path.lower().endswith(".pdf"):
-                reader = PdfReader(document_path)
-                for page in reader.pages:
-                    document_text += page.extract_text() or ""
-            elif document_path.lower().endswith((".txt", ".md")):
-                with open(document_path, 'r', encoding='utf-8') as f:
-                    document_text = f.read()
-            else:
-                raise ValueError(f"Unsupported file type: {document_path}")
-
+            progress("reading_document", {"gcs_uri": gcs_uri})
+            document_text = self._read_document(gcs_uri)
         except Exception as e:
             logging.error(f"Failed to download or read document: {e}", exc_info=True)
             raise
-        finally:
-            if document_path and os.path.exists(document_path):
-                os.remove(document_path)
 
         # 2. Parse the requirements from the document text
-        requirements = self.gemini.parse_requirements(document_text)
+        progress("parsing_requirements", {"characters": len(document_text)})
+        requirements = self.gemini.parse_requirements(document_text, max_workers=self.max_workers)
+        progress("generating_test_cases", {"requirements": len(requirements)})
 
         # 3. For each requirement, find relevant compliance information and generate test cases
         all_test_cases = []
-        for req in requirements:
-            logging.info(f"Processing requirement: {req.get('requirement_id')}")
-            query = f"{req.get('title')} {req.get('description')}"
-            compliance_context = self.day2_setup.search_compliance_knowledge_base(query)
-            
-            test_cases = self.gemini.generate_test_cases_with_compliance(req, compliance_context)
+        for test_cases in self._generate_incrementally(document_key or gcs_uri, requirements, on_test_case):
             all_test_cases.extend(test_cases)
 
         # 4. Now, run compliance analysis with the generated test cases
         logging.info("Running final compliance analysis with generated test cases...")
+        progress("analyzing_compliance", {"test_cases": len(all_test_cases)})
         compliance_results = process_document_for_compliance(document_text, all_test_cases)
 
+        logging.info(f"Compliance search cache: {self.day2_setup.search_cache_stats()}")
+        if self.gemini.cache:
+            logging.info(f"Gemini response cache: {self.gemini.cache.stats()}")
         logging.info("--- RAG Pipeline Completed Successfully! ---")
+        progress("pipeline_complete", {"test_cases": len(all_test_cases)})
         
         # 5. Combine results into the final output structure
         final_output = {
@@ -114,9 +352,57 @@ class RAGPipeline:
         return final_output
 
 
+def run_job(pipeline: RAGPipeline, gcs_uri: str, emit: Callable[[str], None]) -> str:
+    """
+    Runs the pipeline for one document and saves the results to a unique file in /tmp.
+
+    Progress is reported through emit as the lines the Node.js server reads from stdout:
+    "PROGRESS:<json>" lines as each stage starts, a "TEST_CASE:<json>" line per generated
+    test case, then "SUCCESS:<results file>". The file is JSON or NDJSON, optionally gzipped,
+    per PIPELINE_OUTPUT_FORMAT and PIPELINE_OUTPUT_GZIP.
+
+    Args:
+        pipeline: The (possibly long-lived) pipeline to run.
+        gcs_uri: The GCS URI of the document to process.
+        emit: Called with each output line.
+
+    Returns:
+        The path of the results file.
+    """
+    # In a Cloud Function environment, only the /tmp directory is writable.
+    # The writer creates a unique filename to avoid conflicts between invocations.
+    writer = ResultWriter("/tmp", PIPELINE_OUTPUT_FORMAT, PIPELINE_OUTPUT_GZIP)
+
+    def emit_progress(stage: str, details: Dict[str, Any]):
+        emit(f"PROGRESS:{dumps({'stage': stage, **details})}")
+
+    def emit_test_case(test_case: Dict[str, Any]):
+        # Stream each test case so the Node.js server can show it before the pipeline finishes.
+        emit(f"TEST_CASE:{dumps(test_case)}")
+
+    try:
+        with writer:
+            results = pipeline.run_pipeline(gcs_uri, on_test_case=emit_test_case, on_progress=emit_progress)
+            emit_progress("writing_results", {"format": writer.output_format})
+            writer.write_results(results)
+    except Exception:
+        if os.path.exists(writer.path):
+            os.remove(writer.path)
+        raise
+
+    # IMPORTANT: Report the filename so the Node.js server knows where to find it.
+    emit(f"SUCCESS:{writer.path}")
+
+    logging.info(f"Pipeline finished. Results saved to '{writer.path}'.")
+    return writer.path
+
+
 def main():
     """
     Main function to run the RAG pipeline.
+
+    When PIPELINE_WORKER_URL is set, the job is sent to a running pipeline worker and its
+    output relayed; the pipeline only runs in this process if the worker is unreachable.
     """
     try:
         if len(sys.argv) < 2:
@@ -124,20 +410,16 @@ def main():
             sys.exit(1)
         
         gcs_uri = sys.argv[1]
+
+        if PIPELINE_WORKER_URL:
+            from pipeline_worker import run_remote
+            exit_code = run_remote(PIPELINE_WORKER_URL, gcs_uri)
+            if exit_code is not None:
+                sys.exit(exit_code)
+            logging.warning(f"Pipeline worker at {PIPELINE_WORKER_URL} is unreachable; running the job in this process.")
+
         pipeline = RAGPipeline()
-        results = pipeline.run_pipeline(gcs_uri)
-        
-        # In a Cloud Function environment, only the /tmp directory is writable.
-        # We create a unique filename to avoid conflicts between invocations.
-        output_filename = os.path.join("/tmp", f"results_{uuid.uuid4()}.json")
-        
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            json.dump(results, f, indent=2)
-            
-        # IMPORTANT: Print the filename to stdout so the Node.js server knows where to find it.
-        print(f"SUCCESS:{output_filename}")
-            
-        logging.info(f"Pipeline finished. Results saved to '{output_filename}'.")
+        run_job(pipeline, gcs_uri, lambda line: print(line, flush=True))
 
     except Exception as e:
         import traceback
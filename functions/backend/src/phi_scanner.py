@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Chunked PHI/PII Span Scanner for HealthGuard AI.
+
+detect_violations answers yes/no per rule for a whole document held in memory.
+This scanner finds the individual identifiers (SSNs, MRNs, dates of birth,
+phone numbers, emails, card numbers, IP addresses) and reports the exact
+character span and page of each one. Text is consumed as a stream of pieces
+(e.g. straight from the PDF page generator), cut into overlapping chunks and
+matched against one precompiled pattern, so memory stays constant however large
+the input is. Chunks can be scanned on a process pool.
+
+Offsets are into the concatenated text; pages are separated by form feeds, as in
+the text RAGPipeline reads. Run it over a large export with:
+
+    python phi_scanner.py export.txt --workers 4 > findings.jsonl
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Dict, Any, Tuple
+
+# Each identifier type is a named group of one combined, case-insensitive pattern. All types
+# but phone numbers start at a word boundary, which is checked once per position; the types
+# that start with a digit are only tried where one is, and the email local part is only
+# scanned where an "@" follows.
+_WORD_START_PATTERNS = {
+    "mrn": r"(?:mrn|medical record (?:number|no\.?|#))[\s:#-]*[a-z]?\d{5,12}\b",
+    "date_of_birth": r"(?:dob|date of birth|birth ?date|born(?: on)?)[\s:]*"
+                     r"(?:\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|\d{4}-\d{2}-\d{2}|[a-z]{3,9}\.? \d{1,2},? \d{4})",
+    "email": r"(?=[a-z0-9._%+-]*@)[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}\b",
+}
+_DIGIT_START_PATTERNS = {
+    "ssn": r"(?!000|666|9\d\d)\d{3}-(?!00)\d{2}-(?!0000)\d{4}\b",
+    "credit_card": r"(?:\d[ -]?){12,18}\d\b",
+    "ip_address": r"(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d)\b",
+}
+_PHONE_PATTERN = r"(?=[(+\d])(?<![\w-])(?:\+?1[ .-]?)?\(?\d{3}\)?[ .-]\d{3}[ .-]\d{4}\b"
+
+
+def _named(patterns: Dict[str, str]) -> str:
+    return "|".join(f"(?P<{name}>{pattern})" for name, pattern in patterns.items())
+
+
+PHI_TYPES = sorted([*_WORD_START_PATTERNS, *_DIGIT_START_PATTERNS, "phone"])
+PHI_PATTERN = re.compile(
+    rf"\b(?:(?=\d)(?:{_named(_DIGIT_START_PATTERNS)})|{_named(_WORD_START_PATTERNS)})|(?P<phone>{_PHONE_PATTERN})",
+    re.IGNORECASE
+)
+
+# Default chunk size, and the characters shared by neighbouring chunks; identifiers longer
+# than the overlap may be missed where they cross a chunk boundary.
+DEFAULT_CHUNK_CHARS = 1024 * 1024
+DEFAULT_OVERLAP_CHARS = 512
+
+PAGE_BREAK = "\f"
+
+
+def _luhn_valid(digits: str) -> bool:
+    total = 0
+    for i, char in enumerate(reversed(digits)):
+        value = int(char)
+        if i % 2:
+            value = value * 2 - 9 if value > 4 else value * 2
+        total += value
+    return total % 10 == 0
+
+
+def mask(value: str) -> str:
+    """
+    Masks an identifier, keeping only its last four characters.
+    """
+    return "*" * max(0, len(value) - 4) + value[-4:]
+
+
+def _scan_chunk(chunk: Tuple[str, int, int, int, int]) -> List[Dict[str, Any]]:
+    """
+    Scans one chunk and returns the spans that start in the chunk's own region.
+
+    Args:
+        chunk: (text, offset of text, start and end of the region this chunk reports,
+            page number at the start of text).
+    """
+    text, text_start, owned_start, owned_end, page = chunk
+    spans = []
+    last = 0
+    for match in PHI_PATTERN.finditer(text):
+        start = text_start + match.start()
+        if start < owned_start:
+            continue
+        if start >= owned_end:
+            break
+        kind = match.lastgroup
+        value = match.group()
+        if kind == "credit_card" and not _luhn_valid(re.sub(r"\D", "", value)):
+            continue
+        page += text.count(PAGE_BREAK, last, match.start())
+        last = match.start()
+        spans.append({"type": kind, "start": start, "end": start + len(value), "page": page, "masked": mask(value)})
+    return spans
+
+
+def iter_chunks(pieces: Iterable[str], chunk_chars: int = DEFAULT_CHUNK_CHARS,
+                overlap_chars: int = DEFAULT_OVERLAP_CHARS) -> Iterator[Tuple[str, int, int, int, int]]:
+    """
+    Cuts a stream of text pieces into overlapping chunks, holding at most about
+    chunk_chars + 2 * overlap_chars characters (plus one piece) in memory.
+
+    Yields:
+        (text, offset of text, start and end of the region the chunk reports, page at the start of text).
+        Each chunk's text extends overlap_chars on both sides of its region, so identifiers that
+        cross the region's edges are matched whole, and reported by exactly one chunk.
+    """
+    chunk_chars = max(1, chunk_chars)
+    buffer = ""
+    buffer_start = 0  # offset of buffer[0]
+    buffer_page = 1   # page at buffer[0]
+    owned_start = 0
+
+    def take_chunk(owned_end: int) -> Tuple[str, int, int, int, int]:
+        text_start = max(buffer_start, owned_start - overlap_chars)
+        text = buffer[text_start - buffer_start:owned_end + overlap_chars - buffer_start]
+        page = buffer_page + buffer.count(PAGE_BREAK, 0, text_start - buffer_start)
+        return text, text_start, owned_start, owned_end, page
+
+    for piece in pieces:
+        buffer += piece
+        while buffer_start + len(buffer) >= owned_start + chunk_chars + overlap_chars:
+            owned_end = owned_start + chunk_chars
+            yield take_chunk(owned_end)
+            owned_start = owned_end
+            # Drop text no later chunk can see.
+            drop = owned_start - overlap_chars - buffer_start
+            if drop > 0:
+                buffer_page += buffer.count(PAGE_BREAK, 0, drop)
+                buffer, buffer_start = buffer[drop:], buffer_start + drop
+
+    total = buffer_start + len(buffer)
+    if owned_start < total or total == 0:
+        yield take_chunk(total)
+
+
+def with_page_breaks(pages: Iterable[str]) -> Iterator[str]:
+    """
+    Yields pages separated by form feeds, so span pages can be numbered.
+    """
+    for number, page in enumerate(pages):
+        if number:
+            yield PAGE_BREAK
+        yield page
+
+
+def scan_stream(pieces: Iterable[str], chunk_chars: int = DEFAULT_CHUNK_CHARS,
+                overlap_chars: int = DEFAULT_OVERLAP_CHARS, max_workers: int = 1) -> Iterator[Dict[str, Any]]:
+    """
+    Finds PHI/PII identifiers in a stream of text, in document order.
+
+    Args:
+        pieces: The text, in pieces of any size (pages should be separated by form feeds;
+            see with_page_breaks).
+        chunk_chars: Characters scanned per chunk.
+        overlap_chars: Characters shared by neighbouring chunks; at least the longest identifier.
+        max_workers: Processes scanning chunks in parallel; 1 scans in this process.
+
+    Yields:
+        A span per identifier: its "type", "start" and "end" offsets, 1-based "page" and a
+        "masked" copy of the value.
+    """
+    chunks = iter_chunks(pieces, chunk_chars, overlap_chars)
+    if max_workers <= 1:
+        for chunk in chunks:
+            yield from _scan_chunk(chunk)
+        return
+
+    # Only a few chunks are in flight at a time, keeping memory bounded; results keep chunk order.
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(_scan_chunk, chunk))
+            if len(in_flight) >= max_workers * 2:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def scan_text(text: str) -> List[Dict[str, Any]]:
+    """
+    Finds PHI/PII identifiers in a document already in memory.
+    """
+    return list(scan_stream([text]))
+
+
+def main():
+    """
+    Scans a text file (or stdin) and writes one JSON span per line to stdout.
+    """
+    parser = argparse.ArgumentParser(description="Find PHI/PII identifiers in a large text export.")
+    parser.add_argument("path", nargs="?", default="-", help="Text file to scan (default: stdin).")
+    parser.add_argument("--workers", type=int, default=1, help="Processes scanning chunks in parallel (0 = one per CPU).")
+    parser.add_argument("--chunk-chars", type=int, default=DEFAULT_CHUNK_CHARS, help="Characters per chunk.")
+    args = parser.parse_args()
+
+    stream = sys.stdin if args.path == "-" else open(args.path, "r", encoding="utf-8", errors="replace")
+    with stream:
+        blocks = iter(lambda: stream.read(args.chunk_chars), "")
+        for span in scan_stream(blocks, args.chunk_chars, max_workers=args.workers or os.cpu_count() or 1):
+            sys.stdout.write(json.dumps(span) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Long-Lived Pipeline Worker for HealthGuard AI.
+
+Running 'main_pipeline.py <gcs_uri>' once per job pays for interpreter startup,
+Google Cloud imports, configuration loading, client construction and the search
+engine lookup every time. This module keeps one warm RAGPipeline in a server
+process and accepts jobs over a small local HTTP API:
+
+    GET  /health              -> {"status": "ok", "active_jobs": <n>}
+    POST /run {"gcs_uri": ..} -> streamed "PROGRESS:<json>" and "TEST_CASE:<json>" lines,
+                                 then "SUCCESS:<results file>" or "PYTHON SCRIPT ERROR: ..."
+
+The streamed lines are exactly what the CLI prints, so the CLI can act as a thin
+client (see run_remote) without changing what the Node.js server parses.
+
+Usage:
+    python pipeline_worker.py --serve            # start the worker
+    python pipeline_worker.py <gcs_uri>          # submit a job to a running worker
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import json
+import logging
+import sys
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class PipelineWorkerHandler(BaseHTTPRequestHandler):
+    """
+    Handles one HTTP request against the worker's shared pipeline.
+    """
+
+    server: "PipelineWorkerServer"
+
+    def _send_json(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "active_jobs": self.server.active_jobs})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path != "/run":
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+            gcs_uri = json.loads(self.rfile.read(length) or b"{}")["gcs_uri"]
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"Expected a JSON body with 'gcs_uri': {e}"})
+            return
+
+        # The body is streamed until the connection closes, so no Content-Length is sent.
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.end_headers()
+        self.server.run_job(gcs_uri, self._emit)
+
+    def _emit(self, line: str):
+        self.wfile.write(f"{line}\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def log_message(self, format: str, *args):
+        logging.info(f"Pipeline worker: {self.address_string()} - {format % args}")
+
+
+class PipelineWorkerServer(ThreadingHTTPServer):
+    """
+    A threaded HTTP server that runs every job on one long-lived RAGPipeline.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, max_jobs: int = 4):
+        """
+        Args:
+            address: (host, port) to listen on.
+            max_jobs: Maximum number of jobs run at the same time; further jobs wait.
+        """
+        super().__init__(address, PipelineWorkerHandler)
+        from main_pipeline import RAGPipeline
+
+        logging.info("Warming up the pipeline worker...")
+        self.pipeline = RAGPipeline()
+        self.active_jobs: int = 0
+        self._job_slots = threading.BoundedSemaphore(max(1, max_jobs))
+        self._count_lock = threading.Lock()
+
+    def _healthy_pipeline(self):
+        """
+        Returns the shared pipeline, rebuilt first if one of its clients hit a credentials error.
+        """
+        from main_pipeline import RAGPipeline
+
+        with self._count_lock:
+            if self.pipeline.credentials_error:
+                logging.warning(f"Rebuilding pipeline clients after a credentials error: {self.pipeline.credentials_error}")
+                self.pipeline = RAGPipeline()
+            return self.pipeline
+
+    def run_job(self, gcs_uri: str, emit):
+        """
+        Runs one job, reporting its output lines (or its error) through emit.
+        """
+        from main_pipeline import run_job
+
+        with self._job_slots:
+            with self._count_lock:
+                self.active_jobs += 1
+            lock = threading.Lock()
+
+            def emit_line(line: str):
+                with lock:
+                    emit(line)
+
+            try:
+                logging.info(f"Pipeline worker starting job for {gcs_uri}")
+                run_job(self._healthy_pipeline(), gcs_uri, emit_line)
+            except (BrokenPipeError, ConnectionResetError):
+                logging.warning(f"Client disconnected during job for {gcs_uri}")
+            except Exception as e:
+                logging.error(f"Pipeline worker job failed for {gcs_uri}: {e}", exc_info=True)
+                try:
+                    emit_line(f"PYTHON SCRIPT ERROR: An unexpected error occurred: {e}")
+                except OSError:
+                    pass
+            finally:
+                with self._count_lock:
+                    self.active_jobs -= 1
+
+
+def run_remote(worker_url: str, gcs_uri: str) -> Optional[int]:
+    """
+    Submits a job to a running worker and relays its output lines to stdout.
+
+    Args:
+        worker_url: Base URL of the worker, e.g. http://127.0.0.1:8765.
+        gcs_uri: The GCS URI of the document to process.
+
+    Returns:
+        The exit code for the CLI (0 on success, 1 on failure), or None if the worker
+        could not be reached and the job was never started.
+    """
+    request = urllib.request.Request(
+        f"{worker_url.rstrip('/')}/run",
+        data=json.dumps({"gcs_uri": gcs_uri}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        response = urllib.request.urlopen(request)
+    except urllib.error.HTTPError as e:
+        print(f"PYTHON SCRIPT ERROR: Pipeline worker rejected the job: {e.read().decode('utf-8', 'replace')}", flush=True)
+        return 1
+    except (urllib.error.URLError, ConnectionError) as e:
+        logging.warning(f"Could not reach pipeline worker at {worker_url}: {e}")
+        return None
+
+    exit_code = 1
+    with response:
+        for raw_line in response:
+            line = raw_line.decode("utf-8").rstrip("\n")
+            print(line, flush=True)
+            if line.startswith("SUCCESS:"):
+                exit_code = 0
+    return exit_code
+
+
+def main():
+    """
+    Starts the worker with --serve, otherwise submits the given GCS URI to a running worker.
+    """
+    if len(sys.argv) < 2:
+        print("Usage: python pipeline_worker.py --serve | <gcs_uri>", file=sys.stderr)
+        sys.exit(1)
+
+    # Loads .env before any PIPELINE_WORKER_* setting is used, in both server and client mode.
+    from config import PIPELINE_WORKER_HOST, PIPELINE_WORKER_PORT, PIPELINE_WORKER_MAX_JOBS, PIPELINE_WORKER_URL
+
+    if sys.argv[1] == "--serve":
+        server = PipelineWorkerServer((PIPELINE_WORKER_HOST, PIPELINE_WORKER_PORT), PIPELINE_WORKER_MAX_JOBS)
+        logging.info(f"Pipeline worker listening on http://{PIPELINE_WORKER_HOST}:{PIPELINE_WORKER_PORT}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logging.info("Pipeline worker shutting down.")
+        finally:
+            server.server_close()
+        return
+
+    worker_url = PIPELINE_WORKER_URL or f"http://{PIPELINE_WORKER_HOST}:{PIPELINE_WORKER_PORT}"
+    exit_code = run_remote(worker_url, sys.argv[1])
+    if exit_code is None:
+        print(f"PYTHON SCRIPT ERROR: Pipeline worker at {worker_url} is unreachable.", flush=True)
+        exit_code = 1
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,8 @@ from dotenv import load_dotenv
 from google.cloud import storage
 from google.api_core import exceptions
 
+from gcs_sync import sync_files_to_bucket
+
 # --- Configuration ---
 logging.basicConfig(
     level=logging.INFO,
@@ -95,7 +97,8 @@ class KnowledgeBasePopulator:
 
     def upload_to_gcs(self):
         """
-        Uploads all PDF and JSON files to the target GCS bucket.
+        Uploads all PDF and JSON files to the target GCS bucket, in parallel,
+        skipping files whose content is already in the bucket.
         """
         logging.info(f"Uploading knowledge base to gs://{self.target_bucket_name}...")
         
@@ -106,14 +109,13 @@ class KnowledgeBasePopulator:
             logging.error("Please ensure you have run setup_day1.py successfully.")
             return
 
-        for file_path in self.local_kb_path.rglob("*"):
-            if file_path.is_file() and file_path.suffix in ['.pdf', '.json']:
-                destination_blob_name = file_path.relative_to(self.local_kb_path).as_posix()
-                blob = bucket.blob(destination_blob_name)
-                
-                logging.info(f"Uploading {file_path} to gs://{self.target_bucket_name}/{destination_blob_name}...")
-                blob.upload_from_filename(str(file_path))
-        
+        files = [
+            (str(file_path), file_path.relative_to(self.local_kb_path).as_posix())
+            for file_path in sorted(self.local_kb_path.rglob("*"))
+            if file_path.is_file() and file_path.suffix in ['.pdf', '.json']
+        ]
+        sync_files_to_bucket(bucket, files, max_workers=int(os.getenv("GCS_UPLOAD_WORKERS", "8")))
+
         logging.info("All knowledge base files uploaded successfully.")
         logging.info("Vertex AI Search will now begin indexing these documents.")
 
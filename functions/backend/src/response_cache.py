@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent Response Cache for HealthGuard AI.
+
+This module provides a content-addressed, on-disk key/value cache backed by
+SQLite. It is used to avoid re-paying for identical model calls across runs.
+Entries are evicted least-recently-used once the cache exceeds its size bound,
+and may optionally expire after a TTL. SQLite's WAL mode and busy timeout make
+the cache safe to share between several worker processes.
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Any
+
+
+class ResponseCache:
+    """
+    A size-bounded LRU cache of text values stored in a SQLite database.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, ttl_seconds: Optional[float] = None):
+        """
+        Opens (or creates) the cache database.
+
+        Args:
+            path: The SQLite database file.
+            max_bytes: Total size of stored values above which the least recently used entries are evicted.
+            ttl_seconds: Optional lifetime of an entry. None or 0 keeps entries until evicted.
+        """
+        self.path: str = path
+        self.max_bytes: int = max_bytes
+        self.ttl_seconds: Optional[float] = ttl_seconds or None
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """
+        Builds a content-addressed cache key from its parts (e.g. model name, template version, prompt).
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            encoded = str(part).encode("utf-8")
+            digest.update(len(encoded).to_bytes(8, "big"))
+            digest.update(encoded)
+        return digest.hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Returns a connection owned by the current thread and process.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the cached value for key, or None if it is missing or expired.
+        """
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+            value, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._count("misses")
+                return None
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count("hits")
+            return value
+        except sqlite3.Error as e:
+            logging.warning(f"Response cache read failed, treating as a miss: {e}")
+            self._count("misses")
+            return None
+
+    def put(self, key: str, value: str):
+        """
+        Stores value under key and evicts least recently used entries if the cache is over its size bound.
+        """
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, size, now, now)
+                )
+                self._evict(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logging.warning(f"Response cache write failed, continuing without caching: {e}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        """
+        Removes expired entries, then least recently used entries until the total size fits max_bytes.
+        """
+        if self.ttl_seconds:
+            cursor = conn.execute("DELETE FROM entries WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            self._count("evictions", max(cursor.rowcount, 0))
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        self._count("evictions", len(evicted))
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        self._connection().execute("DELETE FROM entries")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns hit/miss counters for this process along with the current cache size.
+        """
+        entries, size = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_bytes": size,
+        }
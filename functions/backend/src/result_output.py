@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Compact, Streamed Pipeline Result Files for HealthGuard AI.
+
+Results used to be written as one indented JSON document. A ResultWriter can
+instead write NDJSON: one {"type": "test_case"} record per line for each of the
+run's final test cases, then a {"type": "compliance_analysis"} record, so
+readers can process a large result without loading it whole. Output can be
+gzip-compressed, and all JSON is encoded compactly, with orjson when it is
+installed.
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import gzip
+import json
+import os
+import uuid
+from typing import Any, Dict, Optional, TextIO
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library encoder is used instead
+    orjson = None
+
+FORMATS = ("json", "ndjson")
+
+
+def dumps(value: Any) -> str:
+    """
+    Encodes a value as compact JSON, using orjson when available.
+    """
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, separators=(",", ":"))
+
+
+class ResultWriter:
+    """
+    Writes one pipeline run's results to a uniquely named file.
+    """
+
+    def __init__(self, directory: str = "/tmp", output_format: str = "json", compress: bool = False):
+        """
+        Args:
+            directory: Where the results file is created.
+            output_format: "json" for a single document, or "ndjson" for one record per line.
+            compress: Gzip the file (adds ".gz" to its name).
+        """
+        if output_format not in FORMATS:
+            raise ValueError(f"Unsupported output format '{output_format}'. Expected one of {FORMATS}.")
+        self.output_format: str = output_format
+        self.path: str = os.path.join(
+            directory, f"results_{uuid.uuid4()}.{output_format}{'.gz' if compress else ''}"
+        )
+        if compress:
+            self._file: TextIO = gzip.open(self.path, "wt", encoding="utf-8", compresslevel=5)
+        else:
+            self._file = open(self.path, "w", encoding="utf-8")
+
+    def write_results(self, results: Dict[str, Any]):
+        """
+        Writes the run's final results: the whole document for JSON, or for NDJSON a record
+        per test case in results["generated_test_cases"] followed by the compliance analysis.
+        """
+        if self.output_format == "ndjson":
+            for test_case in results.get("generated_test_cases", []):
+                self._file.write(dumps({"type": "test_case", "test_case": test_case}) + "\n")
+            record = {"type": "compliance_analysis", "compliance_analysis": results.get("compliance_analysis")}
+            self._file.write(dumps(record) + "\n")
+        else:
+            self._file.write(dumps(results))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
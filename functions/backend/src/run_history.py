@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Per-Document Run History for Incremental Re-Analysis.
+
+Requirement specifications are revised many times. This module remembers, for
+each document, the test cases generated for every requirement, keyed by a
+fingerprint of the requirement's content. When a new revision of the document is
+processed, requirements whose fingerprint is unchanged reuse their previous test
+cases, and only added or changed requirements are sent to search and Gemini.
+History is kept per generator version (model and prompt templates), so changing
+either regenerates every requirement once.
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import hashlib
+import json
+import logging
+from typing import List, Dict, Any, Optional
+
+from response_cache import ResponseCache
+
+REQUIREMENT_FIELDS = ("requirement_id", "title", "description", "acceptance_criteria")
+
+
+def requirement_fingerprint(requirement: Dict[str, Any]) -> str:
+    """
+    Returns a content fingerprint of a requirement that ignores case and whitespace differences.
+    """
+    normalized = {}
+    for field in REQUIREMENT_FIELDS:
+        value = requirement.get(field)
+        text = value if isinstance(value, str) else json.dumps(value, sort_keys=True)
+        normalized[field] = " ".join(text.lower().split())
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+def is_fallback_test_case(test_case: Dict[str, Any]) -> bool:
+    """
+    True for the placeholder test cases returned when generation fails; they are never reused.
+    """
+    return str(test_case.get("test_case_id", "")).startswith("TC-DEMO-")
+
+
+class RunHistory:
+    """
+    Stores the test cases of each document's latest run, keyed by requirement fingerprint.
+    """
+
+    def __init__(self, store: ResponseCache, version: str = ""):
+        """
+        Args:
+            store: The persistent key/value store holding one entry per document.
+            version: Identifies what generated the test cases (e.g. the model name and prompt
+                template versions). History saved under another version is not reused.
+        """
+        self.store: ResponseCache = store
+        self.version: str = version
+
+    def _key(self, document_key: str) -> str:
+        return ResponseCache.make_key("run-history", self.version, document_key)
+
+    def load(self, document_key: str) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Returns the previous run's test cases for a document, keyed by requirement fingerprint.
+        """
+        value = self.store.get(self._key(document_key))
+        if value is None:
+            return {}
+        try:
+            return json.loads(value)["test_cases_by_fingerprint"]
+        except (ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable run history for {document_key}: {e}")
+            return {}
+
+    def save(self, document_key: str, test_cases_by_fingerprint: Dict[str, List[Dict[str, Any]]]):
+        """
+        Replaces a document's history with the given run. Requirements whose test cases
+        include generation fallbacks are left out so they are regenerated next time.
+        """
+        reusable = {
+            fingerprint: test_cases
+            for fingerprint, test_cases in test_cases_by_fingerprint.items()
+            if test_cases and not any(is_fallback_test_case(test_case) for test_case in test_cases)
+        }
+        self.store.put(self._key(document_key), json.dumps({"test_cases_by_fingerprint": reusable}))
+
+
+def open_run_history(path: Optional[str], max_bytes: int, version: str = "") -> Optional[RunHistory]:
+    """
+    Opens the run history at path, or returns None if it is disabled or cannot be opened.
+    """
+    if not path:
+        return None
+    try:
+        return RunHistory(ResponseCache(path, max_bytes), version)
+    except Exception as e:
+        logging.warning(f"Could not open run history at {path}, continuing without incremental re-analysis: {e}")
+        return None
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Compliance Search Cache for HealthGuard AI.
+
+This module memoizes compliance knowledge base searches. Results are kept in an
+in-process LRU and, optionally, in an on-disk ResponseCache shared between worker
+processes. Concurrent lookups of the same query are coalesced so only one search
+is in flight at a time. Every entry is tied to the data store's import
+generation, so results fetched before the last document import are never reused.
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, Optional, Tuple
+
+from response_cache import ResponseCache
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a search query so trivially different spellings share a cache entry.
+    """
+    return " ".join(query.lower().split())
+
+
+class SearchCache:
+    """
+    A two-level, single-flight cache of search results keyed on (scope, normalized query).
+
+    The scope is typically the search serving config. Entries expire after ttl_seconds,
+    and all entries for a scope are invalidated by mark_imported().
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = None,
+                 disk_cache: Optional[ResponseCache] = None):
+        """
+        Args:
+            max_entries: Size of the in-process LRU. 0 disables it.
+            ttl_seconds: Optional lifetime of an entry. None or 0 keeps entries until the next import.
+            disk_cache: Optional persistent cache shared with other processes.
+        """
+        self.max_entries: int = max_entries
+        self.ttl_seconds: Optional[float] = ttl_seconds or None
+        self.disk_cache: Optional[ResponseCache] = disk_cache
+        self.memory_hits: int = 0
+        self.disk_hits: int = 0
+        self.misses: int = 0
+        self.coalesced: int = 0
+        self.miss_seconds: float = 0.0
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._in_flight: Dict[str, Future] = {}
+        self._generations: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _generation(self, scope: str) -> str:
+        """
+        Returns the import generation of a scope, read from the disk cache when there is one
+        so that imports made by other processes are seen.
+        """
+        if self.disk_cache:
+            generation = self.disk_cache.get(ResponseCache.make_key("search-generation", scope))
+            if generation is not None:
+                return generation
+        return self._generations.get(scope, "0")
+
+    def mark_imported(self, scope: str):
+        """
+        Records that the documents behind scope changed, invalidating every cached result for it.
+        """
+        generation = str(time.time())
+        with self._lock:
+            self._generations[scope] = generation
+            self._entries.clear()
+        if self.disk_cache:
+            self.disk_cache.put(ResponseCache.make_key("search-generation", scope), generation)
+
+    def _lookup(self, key: str) -> Optional[str]:
+        """
+        Returns a fresh cached value from memory or disk, promoting disk hits into memory.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if not self.ttl_seconds or now - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._entries[key]
+
+        if self.disk_cache:
+            value = self.disk_cache.get(key)
+            if value is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, value)
+                return value
+        return None
+
+    def _remember(self, key: str, value: str):
+        """
+        Stores a value in the in-process LRU, evicting the least recently used entries.
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, scope: str, query: str, compute: Callable[[], str]) -> str:
+        """
+        Returns the cached result for query, or runs compute() once and caches its result.
+
+        Concurrent callers asking for the same query wait for the first caller's compute()
+        instead of starting their own. If compute() raises, every waiting caller gets the
+        exception and nothing is cached.
+
+        Args:
+            scope: What the query runs against, e.g. the serving config name.
+            query: The raw search query.
+            compute: Performs the actual search.
+
+        Returns:
+            The search result text.
+        """
+        key = ResponseCache.make_key("search", scope, self._generation(scope), normalize_query(query))
+        value = self._lookup(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        started = time.perf_counter()
+        try:
+            value = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+                self.misses += 1
+                self.miss_seconds += time.perf_counter() - started
+
+        self._remember(key, value)
+        if self.disk_cache:
+            self.disk_cache.put(key, value)
+        future.set_result(value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns hit/miss counters and the estimated search time saved by the cache.
+        """
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.coalesced + self.misses
+            mean_miss = self.miss_seconds / self.misses if self.misses else 0.0
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "hit_rate": round((hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+                "mean_search_seconds": round(mean_miss, 4),
+                "saved_seconds": round((hits + self.coalesced) * mean_miss, 3),
+                "entries": len(self._entries),
+            }
@@ -10,12 +10,22 @@ Author: Gemini
 Date: 2025-09-02
 """
 
+import json
 import logging
 import os
-from typing import Optional
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any, Iterable, Iterator, Tuple
 
-from google.api_core.client_options import ClientOptions
-from google.cloud import documentai, storage
+from lazy_imports import lazy_import
+
+# Google Cloud libraries are slow to import; they are loaded on first use.
+exceptions = lazy_import("google.api_core.exceptions")
+client_options = lazy_import("google.api_core.client_options")
+documentai = lazy_import("google.cloud.documentai")
+storage = lazy_import("google.cloud.storage")
 
 # Use the centralized configuration
 from config import (
@@ -24,9 +34,31 @@ from config import (
     GCP_SERVICE_ACCOUNT_KEY_PATH,
     PROCESSOR_DISPLAY_NAME,
     PROCESSOR_TYPE,
-    BUCKET_PREFIX
+    BUCKET_PREFIX,
+    DOCAI_BATCH_MAX_DOCUMENTS,
+    DOCAI_BATCH_POLL_SECONDS,
+    DOCAI_STRUCTURE_WORKERS
 )
 
+# Document types accepted by the processor, by file extension.
+MIME_TYPES = {
+    ".pdf": "application/pdf",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+# Batch output for a large document is split into "<name>-<shard index>.json" files.
+_SHARD_SUFFIX = re.compile(r"-(\d+)\.json$")
+
+
+def _split_gcs_uri(gcs_uri: str) -> Tuple[str, str]:
+    """
+    Splits a gs://bucket/path URI into (bucket, path).
+    """
+    if not gcs_uri.startswith("gs://"):
+        raise ValueError(f"Not a GCS URI: {gcs_uri}")
+    bucket_name, _, path = gcs_uri[len("gs://"):].partition("/")
+    return bucket_name, path
+
 
 class HealthcareQASetup:
     """
@@ -48,10 +80,9 @@ class HealthcareQASetup:
 
         # Redundant validation removed. Central validation is in config.py
 
-        self.docai_client = documentai.DocumentProcessorServiceClient(
-            client_options=ClientOptions(api_endpoint=f"{self.gcp_region}-documentai.googleapis.com")
-        )
-        self.storage_client = storage.Client()
+        # Clients are created on first use; see the docai_client and storage_client properties.
+        self._docai_client = None
+        self._storage_client = None
 
         self.processor_name: str = ""
         self.bucket_names = {
@@ -63,7 +94,25 @@ class HealthcareQASetup:
             "temp": f"{self.bucket_prefix}-temp-staging",
         }
 
-    
+    @property
+    def docai_client(self):
+        """
+        The Document AI client, created on first use.
+        """
+        if self._docai_client is None:
+            self._docai_client = documentai.DocumentProcessorServiceClient(
+                client_options=client_options.ClientOptions(api_endpoint=f"{self.gcp_region}-documentai.googleapis.com")
+            )
+        return self._docai_client
+
+    @property
+    def storage_client(self):
+        """
+        The Cloud Storage client, created on first use.
+        """
+        if self._storage_client is None:
+            self._storage_client = storage.Client()
+        return self._storage_client
 
     def get_or_create_processor(self) -> str:
         """
@@ -168,7 +217,7 @@ class HealthcareQASetup:
         logging.info(f"Processing document with Document AI processor...")
         
         # Determine MIME type from file extension
-        mime_type = "application/pdf" if self.sample_doc_path.lower().endswith('.pdf') else "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        mime_type = MIME_TYPES.get(os.path.splitext(self.sample_doc_path)[1].lower(), MIME_TYPES[".docx"])
 
         request = documentai.ProcessRequest(
             name=self.processor_name,
@@ -205,7 +254,133 @@ class HealthcareQASetup:
             logging.warning(f"Moved failed document to gs://{self.bucket_names['error']}/failed-{blob_name}")
             raise
 
-    def _parse_and_structure_document(self, document: documentai.Document, original_filename: str):
+    def process_documents_batch(self, input_prefix: str, max_workers: int = DOCAI_STRUCTURE_WORKERS) -> Dict[str, Any]:
+        """
+        Processes every document under a GCS prefix with batch Document AI requests and
+        structures the results.
+
+        The documents are split into shards of DOCAI_BATCH_MAX_DOCUMENTS, each submitted as one
+        long-running batch operation. The operations are polled together, and as each one
+        completes its output JSON is streamed back through the structuring step on a thread pool.
+
+        Args:
+            input_prefix: The gs://bucket/prefix holding the documents to process.
+            max_workers: Maximum number of documents structured concurrently.
+
+        Returns:
+            A summary with the number of "documents", the "structured" and "failed" input URIs,
+            the total "requirements" extracted and "seconds".
+        """
+        if not self.processor_name:
+            raise ValueError("Processor has not been created or identified.")
+
+        started = time.perf_counter()
+        bucket_name, prefix = _split_gcs_uri(input_prefix)
+        documents = []
+        for blob in self.storage_client.list_blobs(bucket_name, prefix=prefix or None):
+            mime_type = MIME_TYPES.get(os.path.splitext(blob.name)[1].lower())
+            if mime_type:
+                documents.append(documentai.GcsDocument(gcs_uri=f"gs://{bucket_name}/{blob.name}", mime_type=mime_type))
+
+        summary: Dict[str, Any] = {"documents": len(documents), "structured": [], "failed": [], "requirements": 0}
+        if not documents:
+            logging.warning(f"No documents to process under {input_prefix}.")
+            return summary
+
+        # 1. Submit one batch operation per shard; Document AI writes results under <output>/<operation id>/.
+        output_uri = f"gs://{self.bucket_names['processed']}/batch/"
+        shard_size = max(1, DOCAI_BATCH_MAX_DOCUMENTS)
+        pending = []
+        for start in range(0, len(documents), shard_size):
+            shard = documents[start:start + shard_size]
+            request = documentai.BatchProcessRequest(
+                name=self.processor_name,
+                input_documents=documentai.BatchDocumentsInputConfig(
+                    gcs_documents=documentai.GcsDocuments(documents=shard)
+                ),
+                document_output_config=documentai.DocumentOutputConfig(
+                    gcs_output_config=documentai.DocumentOutputConfig.GcsOutputConfig(gcs_uri=output_uri)
+                ),
+            )
+            shard_uris = [document.gcs_uri for document in shard]
+            try:
+                pending.append((self.docai_client.batch_process_documents(request=request), shard_uris))
+            except exceptions.GoogleAPICallError as e:
+                logging.error(f"API error starting batch processing of {len(shard)} documents: {e}")
+                summary["failed"].extend(shard_uris)
+        logging.info(f"Processing {len(documents)} documents from {input_prefix} in {len(pending)} batch operations...")
+
+        # 2. Poll the operations together, structuring each one's output as soon as it completes.
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="structure") as executor:
+            futures = {}
+            while pending:
+                still_pending = []
+                for operation, shard_uris in pending:
+                    if not operation.done():
+                        still_pending.append((operation, shard_uris))
+                        continue
+                    error = operation.exception()
+                    if error:
+                        logging.error(f"Batch processing of {len(shard_uris)} documents failed: {error}")
+                        summary["failed"].extend(shard_uris)
+                        continue
+                    for status in operation.metadata.individual_process_statuses:
+                        if status.status.code:
+                            logging.error(f"Document AI could not process {status.input_gcs_source}: {status.status.message}")
+                            summary["failed"].append(status.input_gcs_source)
+                            continue
+                        future = executor.submit(self._structure_batch_output, status.output_gcs_destination, status.input_gcs_source)
+                        futures[future] = status.input_gcs_source
+                pending = still_pending
+                if pending:
+                    time.sleep(DOCAI_BATCH_POLL_SECONDS)
+
+            for future in as_completed(futures):
+                input_uri = futures[future]
+                try:
+                    summary["requirements"] += future.result()
+                    summary["structured"].append(input_uri)
+                except Exception as e:
+                    logging.error(f"Failed to structure Document AI output for {input_uri}: {e}")
+                    summary["failed"].append(input_uri)
+
+        summary["seconds"] = round(time.perf_counter() - started, 3)
+        logging.info(
+            f"Batch processed {len(summary['structured'])} of {len(documents)} documents "
+            f"({summary['requirements']} requirements) in {summary['seconds']}s; {len(summary['failed'])} failed."
+        )
+        return summary
+
+    def _iter_output_shards(self, output_uri: str) -> Iterator["documentai.Document"]:
+        """
+        Yields the output shards of one batch-processed document in shard order,
+        downloading each only when it is needed.
+        """
+        bucket_name, prefix = _split_gcs_uri(output_uri)
+        blobs = [
+            blob for blob in self.storage_client.list_blobs(bucket_name, prefix=prefix.rstrip("/") + "/")
+            if blob.name.endswith(".json")
+        ]
+
+        def shard_index(blob) -> int:
+            match = _SHARD_SUFFIX.search(blob.name)
+            return int(match.group(1)) if match else 0
+
+        for blob in sorted(blobs, key=shard_index):
+            yield documentai.Document.from_json(blob.download_as_bytes(), ignore_unknown_fields=True)
+
+    def _structure_batch_output(self, output_uri: str, input_uri: str) -> int:
+        """
+        Structures the batch output of one document and saves it like a single processed document.
+
+        Returns:
+            The number of requirements extracted.
+        """
+        fields = (field for document in self._iter_output_shards(output_uri) for field in self._iter_form_fields(document))
+        # Keep the input's folders in the name so same-named documents do not overwrite each other.
+        return self._save_structured_data(self._iter_requirements(fields), _split_gcs_uri(input_uri)[1])
+
+    def _parse_and_structure_document(self, document: "documentai.Document", original_filename: str):
         """
         Parses the form fields from the processed document and saves structured data.
         
@@ -214,50 +389,78 @@ class HealthcareQASetup:
             original_filename: The name of the original file processed.
         """
         logging.info("Parsing and structuring extracted data...")
-        
+        count = self._save_structured_data(self._iter_requirements(self._iter_form_fields(document)), original_filename)
+        logging.info(f"Extracted {count} requirements.")
+
+    def _iter_form_fields(self, document: "documentai.Document") -> Iterator[Tuple[str, str]]:
+        """
+        Yields the (name, value) text of each form field in the document, in page order.
+
+        All anchors are resolved in one pass against a single copy of the document text,
+        read through the raw protobuf message to avoid wrapping every nested field.
+        """
+        document_pb = documentai.Document.pb(document)
+        text = document_pb.text
+        for page in document_pb.pages:
+            for field in page.form_fields:
+                field_name = self._get_text(field.field_name, text).strip().replace(':', '')
+                field_value = self._get_text(field.field_value, text).strip()
+                yield field_name, field_value
+
+    @staticmethod
+    def _iter_requirements(fields: Iterable[Tuple[str, str]]) -> Iterator[Dict[str, str]]:
+        """
+        Groups form fields into requirements, each starting at a "Requirement ID" field,
+        and yields each requirement as soon as the next one starts.
+        """
         # This parsing logic is specific to the FORM_PARSER and the sample document.
         # It will need to be adapted for different document types or a custom processor.
-        extracted_requirements = []
         current_requirement = {}
 
-        for page in document.pages:
-            for field in page.form_fields:
-                field_name = self._get_text(field.field_name, document).strip().replace(':', '')
-                field_value = self._get_text(field.field_value, document).strip()
-
-                if "Requirement ID" in field_name:
-                    if current_requirement:
-                        extracted_requirements.append(current_requirement)
-                    current_requirement = {"Requirement ID": field_value}
-                elif current_requirement:
-                    current_requirement[field_name] = field_value
-        
+        for field_name, field_value in fields:
+            if "Requirement ID" in field_name:
+                if current_requirement:
+                    yield current_requirement
+                current_requirement = {"Requirement ID": field_value}
+            elif current_requirement:
+                current_requirement[field_name] = field_value
+
         if current_requirement:
-            extracted_requirements.append(current_requirement)
+            yield current_requirement
 
-        logging.info(f"Extracted {len(extracted_requirements)} requirements.")
+    def _save_structured_data(self, requirements: Iterable[Dict[str, str]], original_filename: str) -> int:
+        """
+        Streams requirements to the structured-data bucket as <name>-structured.json, without
+        holding them all in memory. The file is the same indented JSON array as before.
 
-        # Save structured data to GCS
+        Returns:
+            The number of requirements written.
+        """
         structured_bucket = self.storage_client.get_bucket(self.bucket_names["structured"])
         structured_blob_name = f"{os.path.splitext(original_filename)[0]}-structured.json"
         structured_blob = structured_bucket.blob(structured_blob_name)
-        structured_blob.upload_from_string(
-            json.dumps(extracted_requirements, indent=2),
-            content_type="application/json"
-        )
-        logging.info(f"Saved structured data to gs://{self.bucket_names['structured']}/{structured_blob_name}")
+        count = 0
+        with structured_blob.open("wt", encoding="utf-8", ignore_flush=True, content_type="application/json") as stream:
+            # Written element by element, byte-for-byte what json.dumps(requirements, indent=2) produces.
+            stream.write("[")
+            for requirement in requirements:
+                stream.write(",\n  " if count else "\n  ")
+                stream.write(json.dumps(requirement, indent=2).replace("\n", "\n  "))
+                count += 1
+            stream.write("\n]" if count else "]")
+        logging.info(f"Saved {count} structured requirements to gs://{self.bucket_names['structured']}/{structured_blob_name}")
+        return count
 
     @staticmethod
-    def _get_text(el: documentai.Document.Page.Layout, doc: documentai.Document) -> str:
+    def _get_text(el, text: str) -> str:
         """
-        Extracts text from a Document AI text anchor.
+        Extracts the text of a Document AI layout element from the document text.
         """
-        response = ""
-        for segment in el.text_anchor.text_segments:
-            start_index = int(segment.start_index)
-            end_index = int(segment.end_index)
-            response += doc.text[start_index:end_index]
-        return response
+        segments = el.text_anchor.text_segments
+        if len(segments) == 1:
+            segment = segments[0]
+            return text[segment.start_index:segment.end_index]
+        return "".join(text[segment.start_index:segment.end_index] for segment in segments)
 
     def run_setup(self):
         """
@@ -278,9 +481,18 @@ class HealthcareQASetup:
 def main():
     """
     Main function to run the setup script.
+
+    With '--batch gs://bucket/prefix', batch-processes every document under the prefix
+    instead of running the setup.
     """
     try:
         setup = HealthcareQASetup()
+        if len(sys.argv) > 2 and sys.argv[1] == "--batch":
+            setup.get_or_create_processor()
+            summary = setup.process_documents_batch(sys.argv[2])
+            if summary["failed"]:
+                sys.exit(1)
+            return
         setup.run_setup()
     except (ValueError, FileNotFoundError) as e:
         logging.error(f"Configuration Error: {e}")
@@ -11,12 +11,32 @@ Date: 2025-09-03
 
 import logging
 import os
-from typing import Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple
 
 from dotenv import load_dotenv
-from google.api_core import exceptions
-from google.cloud import discoveryengine_v1alpha as discoveryengine
-from google.cloud import storage
+
+from config import (
+    SEARCH_CACHE_PATH, SEARCH_CACHE_MAX_BYTES, SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL_SECONDS,
+    SEARCH_BACKEND, LOCAL_SEARCH_KB_PATH, LOCAL_SEARCH_INDEX_PATH, DENSE_EMBEDDER, DENSE_EMBEDDING_DIM,
+    DENSE_INDEX_PATH, GEMINI_API_KEY, GCS_UPLOAD_WORKERS,
+    IMPORT_BATCH_SIZE, IMPORT_POLL_SECONDS
+)
+from credential_errors import is_credentials_error
+from gcs_sync import sync_files_to_bucket
+from import_manifest import diff_manifest, load_manifest, save_manifest
+from lazy_imports import lazy_import
+from local_search import LocalComplianceIndex
+from response_cache import ResponseCache
+from search_cache import SearchCache
+
+# Google Cloud libraries are slow to import; they are loaded on first use, so the local
+# search backends never import them at all.
+exceptions = lazy_import("google.api_core.exceptions")
+discoveryengine = lazy_import("google.cloud.discoveryengine_v1alpha")
+storage = lazy_import("google.cloud.storage")
 
 # --- Configuration ---
 
@@ -27,6 +47,22 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
+# Returned in place of search results when a search fails, so generation can continue without context.
+SEARCH_ERROR_CONTEXT = "Error: Could not perform compliance search."
+
+
+def format_search_results(results: List[Tuple[str, str, str]]) -> str:
+    """
+    Formats (title, source, snippet) search results into a string for the prompt.
+    """
+    results_str = "Compliance Search Results:\n"
+    for i, (title, source, snippet) in enumerate(results):
+        results_str += f"\n--- Result {i+1} ---\n"
+        results_str += f"Title: {title}\n"
+        results_str += f"Source: {source}\n"
+        results_str += f"Snippet: {snippet}\n"
+    return results_str
+
 
 class VertexAISearchSetup:
     """
@@ -51,15 +87,28 @@ class VertexAISearchSetup:
 
         # Set up Google Cloud clients
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = self.service_account_path
-        self.discoveryengine_client = discoveryengine.DataStoreServiceClient()
-        self.engine_client = discoveryengine.EngineServiceClient()
-        self.document_client = discoveryengine.DocumentServiceClient()
-        self.search_client = discoveryengine.SearchServiceClient()
-        self.storage_client = storage.Client()
+        # Clients are created on first use; the pipeline only ever needs the search client.
+        self._clients: Dict[str, Any] = {}
 
         self.data_store_name: str = ""
         self.engine_name: str = ""
+        # Concurrent first searches wait for one engine lookup instead of each running their own.
+        self._engine_lock = threading.Lock()
         self.structured_data_bucket: str = f"{self.bucket_prefix}-structured-data"
+        self.search_cache: SearchCache = self._create_search_cache()
+
+        # "vertex" searches the Vertex AI Search engine; "local" searches a BM25 index of the local corpus;
+        # "dense" searches a memory-mapped embedding index of the local corpus.
+        self.search_backend: str = SEARCH_BACKEND
+        self.local_kb_path: str = LOCAL_SEARCH_KB_PATH
+        self.local_index_path: str = LOCAL_SEARCH_INDEX_PATH
+        self._local_index: Optional[LocalComplianceIndex] = None
+        # Concurrent first searches wait for one index build instead of each building and saving their own.
+        self._index_lock = threading.Lock()
+        self.dense_index_path: str = DENSE_INDEX_PATH
+        self._dense_index = None
+        # Set when a search fails on credentials but is answered with an error string (see credential_errors).
+        self.credentials_error: Optional[Exception] = None
 
     def _validate_config(self):
         """
@@ -79,6 +128,78 @@ class VertexAISearchSetup:
 
         logging.info("Configuration validated successfully.")
 
+    def _client(self, name: str, factory):
+        """
+        Returns the named client, creating it with factory on first use.
+        """
+        client = self._clients.get(name)
+        if client is None:
+            client = self._clients.setdefault(name, factory())
+        return client
+
+    @property
+    def discoveryengine_client(self):
+        """
+        The Vertex AI Search data store client, created on first use.
+        """
+        return self._client("data_store", lambda: discoveryengine.DataStoreServiceClient())
+
+    @property
+    def engine_client(self):
+        """
+        The Vertex AI Search engine client, created on first use.
+        """
+        return self._client("engine", lambda: discoveryengine.EngineServiceClient())
+
+    @property
+    def document_client(self):
+        """
+        The Vertex AI Search document client, created on first use.
+        """
+        return self._client("document", lambda: discoveryengine.DocumentServiceClient())
+
+    @property
+    def search_client(self):
+        """
+        The Vertex AI Search search client, created on first use.
+        """
+        return self._client("search", lambda: discoveryengine.SearchServiceClient())
+
+    @property
+    def storage_client(self):
+        """
+        The Cloud Storage client, created on first use.
+        """
+        return self._client("storage", lambda: storage.Client())
+
+    @staticmethod
+    def _create_search_cache() -> SearchCache:
+        """
+        Builds the compliance search cache from the SEARCH_CACHE_* settings.
+        """
+        disk_cache = None
+        if SEARCH_CACHE_PATH:
+            try:
+                disk_cache = ResponseCache(SEARCH_CACHE_PATH, SEARCH_CACHE_MAX_BYTES, SEARCH_CACHE_TTL_SECONDS)
+            except Exception as e:
+                logging.warning(f"Could not open search cache at {SEARCH_CACHE_PATH}, caching in memory only: {e}")
+        return SearchCache(
+            max_entries=SEARCH_CACHE_MAX_ENTRIES,
+            ttl_seconds=SEARCH_CACHE_TTL_SECONDS,
+            disk_cache=disk_cache
+        )
+
+    def _serving_config_name(self) -> str:
+        """
+        Returns the default serving config of the search engine, looking the engine up if needed.
+        """
+        if not self.engine_name:
+            with self._engine_lock:
+                if not self.engine_name:
+                    # Ensure engine is identified before searching
+                    self.get_or_create_engine()
+        return f"{self.engine_name}/servingConfigs/default_serving_config"
+
     def get_or_create_data_store(self) -> str:
         """
         Checks for an existing Vertex AI Search data store or creates a new one.
@@ -166,8 +287,13 @@ class VertexAISearchSetup:
 
     def import_compliance_documents(self):
         """
-        Imports compliance documents from the local 'compliance-knowledge-base' directory
+        Imports compliance documents from the local knowledge base (LOCAL_SEARCH_KB_PATH)
         into the Vertex AI Search data store.
+
+        Only documents that are new or changed since the last import (per the import manifest)
+        are imported, and documents deleted locally are purged from the data store. A missing
+        directory, or one without PDFs, is treated as a setup mistake rather than a request to
+        purge everything: the import is skipped and the data store and manifest are left as is.
         """
         if not self.data_store_name:
             raise ValueError("Data store name is not set. Please run get_or_create_data_store() first.")
@@ -183,65 +309,213 @@ class VertexAISearchSetup:
             logging.error(f"Bucket {unstructured_bucket_name} not found. Please run setup_day1.py to create it.")
             raise
 
-        # 2. Upload local PDFs to the GCS bucket
-        local_compliance_dir = "compliance-knowledge-base"
-        pdf_files_to_import = []
+        # 2. Upload new or changed local PDFs to the GCS bucket
+        local_compliance_dir = self.local_kb_path
+        files_to_sync = []
 
         for root, _, files in os.walk(local_compliance_dir):
-            for file in files:
+            for file in sorted(files):
                 if file.endswith(".pdf"):
-                    local_path = os.path.join(root, file)
-                    blob_name = f"{os.path.basename(root)}/{file}"
-                    blob = unstructured_bucket.blob(blob_name)
-                    
-                    logging.info(f"Uploading {local_path} to gs://{unstructured_bucket_name}/{blob_name}")
-                    blob.upload_from_filename(local_path)
-                    
-                    gcs_uri = f"gs://{unstructured_bucket_name}/{blob_name}"
-                    pdf_files_to_import.append(gcs_uri)
-
-        if not pdf_files_to_import:
-            logging.warning("No PDF documents found in 'compliance-knowledge-base' directory. Skipping import.")
+                    files_to_sync.append((os.path.join(root, file), f"{os.path.basename(root)}/{file}"))
+
+        if not files_to_sync:
+            logging.warning(
+                f"No compliance PDFs found in {local_compliance_dir}. Skipping import; "
+                f"the data store is left unchanged."
+            )
             return
 
-        # 3. Import the documents from GCS into the Vertex AI data store
-        logging.info(f"Importing {len(pdf_files_to_import)} documents into data store: {self.data_store_name}")
-        
+        sync = sync_files_to_bucket(unstructured_bucket, files_to_sync, max_workers=GCS_UPLOAD_WORKERS)
+        current = {
+            f"gs://{unstructured_bucket_name}/{blob_name}": state for blob_name, state in sync["objects"].items()
+        }
+
+        # 3. Diff against the manifest of documents already in the data store
+        previous = load_manifest(unstructured_bucket, self.data_store_name)
+        to_import, to_purge = diff_manifest(previous, current)
+        logging.info(
+            f"{len(to_import)} new or changed, {len(to_purge)} deleted and "
+            f"{len(current) - len(to_import)} unchanged compliance documents."
+        )
+        if not to_import and not to_purge:
+            logging.info("Data store is up to date. Skipping import.")
+            return
+
+        purged = self._purge_documents(to_purge)
+        imported = self._import_document_batches(to_import)
+
+        # Record only what succeeded, so failed documents are retried on the next run.
+        manifest = {uri: entry for uri, entry in previous.items() if uri not in purged and uri not in to_import}
+        manifest.update({uri: current[uri] for uri in imported})
+        save_manifest(unstructured_bucket, self.data_store_name, manifest)
+
+        if purged or imported:
+            # Cached search results predate the changed documents.
+            self.search_cache.mark_imported(self._serving_config_name())
+
+        failed = len(to_import) - len(imported) + len(to_purge) - len(purged)
+        if failed:
+            raise RuntimeError(f"{failed} compliance documents could not be imported or purged; they will be retried on the next run.")
+        logging.info("Document import completed successfully.")
+
+    def _import_document_batches(self, uris: List[str]) -> List[str]:
+        """
+        Imports documents in batches of IMPORT_BATCH_SIZE, running all batches' long-running
+        operations concurrently and polling them together.
+
+        Returns:
+            The URIs of the batches that imported without errors.
+        """
+        if not uris:
+            return []
+
         parent_resource = f"{self.data_store_name}/branches/default_branch"
+        batch_size = max(1, IMPORT_BATCH_SIZE)
+        batches = [uris[i:i + batch_size] for i in range(0, len(uris), batch_size)]
+        logging.info(f"Importing {len(uris)} documents into data store {self.data_store_name} in {len(batches)} operations...")
+
+        pending = []
+        for batch in batches:
+            import_request = discoveryengine.ImportDocumentsRequest(
+                parent=parent_resource,
+                gcs_source=discoveryengine.GcsSource(input_uris=batch),
+                reconciliation_mode=discoveryengine.ImportDocumentsRequest.ReconciliationMode.INCREMENTAL
+            )
+            try:
+                pending.append((self.document_client.import_documents(request=import_request), batch))
+            except exceptions.GoogleAPICallError as e:
+                logging.error(f"API error starting document import for {len(batch)} documents: {e}")
+
+        imported: List[str] = []
+        logging.info("Waiting for document import to complete... This may take a few minutes.")
+        while pending:
+            still_pending = []
+            for operation, batch in pending:
+                if not operation.done():
+                    still_pending.append((operation, batch))
+                    continue
+                error = operation.exception()
+                if error:
+                    logging.error(f"Document import failed for {len(batch)} documents: {error}")
+                    continue
+                error_samples = getattr(operation.result(), "error_samples", None)
+                if error_samples:
+                    # The samples do not say which documents failed, so the whole batch is left
+                    # out of the manifest; re-importing the others is harmless (INCREMENTAL mode).
+                    logging.error(f"Document import for {len(batch)} documents reported errors: {error_samples[0]}")
+                    continue
+                imported.extend(batch)
+            pending = still_pending
+            if pending:
+                time.sleep(IMPORT_POLL_SECONDS)
+        return imported
+
+    def _purge_documents(self, uris: List[str]) -> List[str]:
+        """
+        Deletes the data store documents that were imported from the given (now deleted) URIs.
 
-        gcs_source = discoveryengine.GcsSource(input_uris=pdf_files_to_import)
-        import_request = discoveryengine.ImportDocumentsRequest(
-            parent=parent_resource,
-            gcs_source=gcs_source,
-            reconciliation_mode=discoveryengine.ImportDocumentsRequest.ReconciliationMode.INCREMENTAL
-        )
+        Returns:
+            The URIs whose documents are no longer in the data store.
+        """
+        if not uris:
+            return []
 
+        parent_resource = f"{self.data_store_name}/branches/default_branch"
+        wanted = set(uris)
+        purged = set(uris)
         try:
-            operation = self.document_client.import_documents(request=import_request)
-            logging.info("Waiting for document import to complete... This may take a few minutes.")
-            operation.result()
-            logging.info("Document import completed successfully.")
-
+            for document in self.document_client.list_documents(parent=parent_resource):
+                uri = document.content.uri
+                if uri not in wanted:
+                    continue
+                try:
+                    self.document_client.delete_document(name=document.name)
+                    logging.info(f"Purged deleted compliance document {uri}")
+                except exceptions.GoogleAPICallError as e:
+                    logging.error(f"API error purging document {uri}: {e}")
+                    purged.discard(uri)
         except exceptions.GoogleAPICallError as e:
-            logging.error(f"API error during document import: {e}")
-            raise
+            logging.error(f"API error listing data store documents: {e}")
+            return []
+        return sorted(purged)
 
     def search_compliance_knowledge_base(self, search_query: str) -> str:
         """
         Performs a search in the compliance knowledge base.
 
+        With SEARCH_BACKEND=local the query runs against a BM25 index of the local knowledge
+        base. Otherwise results are cached per normalized query until the next document import
+        (or SEARCH_CACHE_TTL_SECONDS), and identical concurrent searches share one request.
+
         Args:
             search_query: The query to search for.
 
         Returns:
             A formatted string of search results.
         """
-        if not self.engine_name:
-            # Ensure engine is identified before searching
-            self.get_or_create_engine()
+        if self.search_backend == "local":
+            return self._search_local(search_query)
+        if self.search_backend == "dense":
+            return self.search_compliance_knowledge_base_batch([search_query])[0]
 
-        serving_config_name = f"{self.engine_name}/servingConfigs/default_serving_config"
+        serving_config_name = self._serving_config_name()
+        try:
+            return self.search_cache.get_or_compute(
+                serving_config_name,
+                search_query,
+                lambda: self._search(serving_config_name, search_query)
+            )
+        except exceptions.GoogleAPICallError as e:
+            if is_credentials_error(e):
+                self.credentials_error = e
+            logging.error(f"API error during search: {e}")
+            return SEARCH_ERROR_CONTEXT
+
+    def search_compliance_knowledge_base_batch(self, search_queries: List[str], max_workers: int = 1) -> List[str]:
+        """
+        Performs many searches in the compliance knowledge base.
 
+        The dense backend answers all queries with one batched embedding and matrix product;
+        the other backends run the queries individually on up to max_workers threads.
+
+        Args:
+            search_queries: The queries to search for.
+            max_workers: Number of concurrent searches for backends without batch support.
+
+        Returns:
+            One formatted string of search results per query, in query order.
+        """
+        if self.search_backend == "dense":
+            from dense_search import EmbeddingError
+            try:
+                hits = self.get_dense_index().search_batch(search_queries, top_k=3)
+            except (OSError, ValueError) as e:
+                logging.error(f"Dense compliance index unavailable: {e}")
+                return [SEARCH_ERROR_CONTEXT] * len(search_queries)
+            except EmbeddingError as e:
+                if is_credentials_error(e):
+                    self.credentials_error = e
+                logging.error(f"API error during dense search: {e}")
+                return [SEARCH_ERROR_CONTEXT] * len(search_queries)
+            logging.info(f"Successfully performed dense search for {len(search_queries)} queries.")
+            return [
+                format_search_results([
+                    (passage["title"], passage["source"], LocalComplianceIndex.snippet(passage))
+                    for passage, _ in query_hits
+                ])
+                for query_hits in hits
+            ]
+
+        workers = max(1, min(max_workers, len(search_queries)))
+        if workers == 1:
+            return [self.search_compliance_knowledge_base(query) for query in search_queries]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search") as executor:
+            return list(executor.map(self.search_compliance_knowledge_base, search_queries))
+
+    def _search(self, serving_config_name: str, search_query: str) -> str:
+        """
+        Sends one search request and formats the results for a prompt.
+        """
         request = discoveryengine.SearchRequest(
             serving_config=serving_config_name,
             query=search_query,
@@ -257,24 +531,63 @@ class VertexAISearchSetup:
             ),
         )
 
-        try:
-            response = self.search_client.search(request)
-            logging.info(f"Successfully performed search for query: '{search_query}'")
-            
-            # Format the results into a string for the prompt
-            results_str = "Compliance Search Results:\n"
-            for i, result in enumerate(response.results):
-                doc = result.document
-                results_str += f"\n--- Result {i+1} ---\n"
-                results_str += f"Title: {doc.derived_struct_data['title']}\n"
-                results_str += f"Source: {doc.name.split('/')[-1]}\n"
-                results_str += f"Snippet: {doc.derived_struct_data['snippets'][0]['snippet']}\n"
-            
-            return results_str
+        response = self.search_client.search(request)
+        logging.info(f"Successfully performed search for query: '{search_query}'")
 
-        except exceptions.GoogleAPICallError as e:
-            logging.error(f"API error during search: {e}")
-            return "Error: Could not perform compliance search."
+        return format_search_results([
+            (
+                result.document.derived_struct_data['title'],
+                result.document.name.split('/')[-1],
+                result.document.derived_struct_data['snippets'][0]['snippet'],
+            )
+            for result in response.results
+        ])
+
+    def get_local_index(self) -> LocalComplianceIndex:
+        """
+        Returns the local BM25 index, loading or building it on first use.
+        """
+        with self._index_lock:
+            if self._local_index is None:
+                self._local_index = LocalComplianceIndex.load_or_build(self.local_kb_path, self.local_index_path or None)
+            return self._local_index
+
+    def get_dense_index(self):
+        """
+        Returns the dense index, memory-mapping or building it on first use.
+        """
+        with self._index_lock:
+            if self._dense_index is None:
+                # Imported here so NumPy is only needed when the dense backend is selected.
+                from dense_search import DenseComplianceIndex, create_embedder
+                embedder = create_embedder(DENSE_EMBEDDER, DENSE_EMBEDDING_DIM, GEMINI_API_KEY)
+                self._dense_index = DenseComplianceIndex.load_or_build(
+                    self.local_kb_path, self.dense_index_path or None, embedder
+                )
+            return self._dense_index
+
+    def _search_local(self, search_query: str) -> str:
+        """
+        Searches the local BM25 index and formats the top results like a Vertex AI Search response.
+        """
+        try:
+            index = self.get_local_index()
+        except (OSError, ValueError) as e:
+            logging.error(f"Local compliance index unavailable: {e}")
+            return SEARCH_ERROR_CONTEXT
+
+        hits = index.search(search_query, top_k=3)
+        logging.info(f"Successfully performed local search for query: '{search_query}'")
+        return format_search_results([
+            (passage["title"], passage["source"], LocalComplianceIndex.snippet(passage))
+            for passage, _ in hits
+        ])
+
+    def search_cache_stats(self) -> Dict[str, Any]:
+        """
+        Returns the compliance search cache's hit rate and estimated time saved.
+        """
+        return self.search_cache.stats()
 
     def run_setup(self):
         """
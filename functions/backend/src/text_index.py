@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Sentence, Paragraph and Section Offset Index for HealthGuard AI.
+
+Compliance checks that care about locality ("is this trigger mitigated in the
+same section?") need to know where sentences, paragraphs and sections begin.
+TextIndex finds all three once per document, in one regex pass each, and keeps
+their start offsets in sorted arrays. Any offset can then be mapped to its unit,
+or to the text span of the N units around it, by binary search; no analysis
+stage has to rescan the text.
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import List, Tuple
+
+UNITS = ("sentence", "paragraph", "section", "document")
+
+# A sentence ends at terminal punctuation (with any closing quotes or brackets) followed by
+# whitespace, at a blank line or at a page break.
+_SENTENCE_BREAK = re.compile(r"[.!?]+[\"')\]]*\s+|\n[ \t]*\n\s*|\f\s*")
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*|\f\s*")
+# Section headings: Markdown headings, numbered headings ("2.", "4.1 Access Control"),
+# "Section 3"/"Appendix A" style headings and short all-caps lines.
+_SECTION_HEADING = re.compile(
+    r"^[ \t]*(?:#{1,6}[ \t]+\S|(?:\d+\.)+\d*[ \t]+[A-Z]|(?i:section|article|chapter|part|appendix)[ \t]+[\w.]+"
+    r"|[A-Z][A-Z0-9 ,/&()-]{3,79}$)",
+    re.MULTILINE
+)
+
+
+class TextIndex:
+    """
+    Sorted start offsets of the sentences, paragraphs and sections of one document.
+    """
+
+    def __init__(self, text: str):
+        """
+        Args:
+            text: The document text. Offsets used with the index refer to this text.
+        """
+        self.length: int = len(text)
+        self.sentence_starts = array("q", [0])
+        self.sentence_starts.extend(m.end() for m in _SENTENCE_BREAK.finditer(text) if m.end() < self.length)
+        self.paragraph_starts = array("q", [0])
+        self.paragraph_starts.extend(m.end() for m in _PARAGRAPH_BREAK.finditer(text) if m.end() < self.length)
+        # Text before the first heading is a section of its own, with no title.
+        self.section_starts = array("q", [0])
+        self.section_titles: List[str] = [""]
+        for match in _SECTION_HEADING.finditer(text):
+            line_end = text.find("\n", match.start())
+            title = text[match.start():line_end if line_end >= 0 else self.length].strip()
+            if match.start() == 0:
+                self.section_titles[0] = title
+            else:
+                self.section_starts.append(match.start())
+                self.section_titles.append(title)
+
+    def _starts(self, unit: str) -> array:
+        if unit == "sentence":
+            return self.sentence_starts
+        if unit == "paragraph":
+            return self.paragraph_starts
+        if unit == "section":
+            return self.section_starts
+        raise ValueError(f"Unknown text unit '{unit}'. Expected one of {UNITS}.")
+
+    def unit_number(self, unit: str, offset: int) -> int:
+        """
+        Returns the 0-based number of the sentence, paragraph or section containing offset.
+        """
+        return bisect_right(self._starts(unit), offset) - 1
+
+    def span(self, unit: str, offset: int, window: int = 0) -> Tuple[int, int]:
+        """
+        Returns the (start, end) offsets of the unit containing offset, widened by window
+        units on each side. The "document" unit is the whole text.
+        """
+        if unit == "document":
+            return 0, self.length
+        starts = self._starts(unit)
+        number = bisect_right(starts, offset) - 1
+        first = max(0, number - window)
+        last = number + window + 1
+        return starts[first], starts[last] if last < len(starts) else self.length
+
+    def same_unit(self, unit: str, first: int, second: int, window: int = 0) -> bool:
+        """
+        True if the two offsets are in the same unit, or at most window units apart.
+        """
+        if unit == "document":
+            return True
+        return abs(self.unit_number(unit, first) - self.unit_number(unit, second)) <= window
+
+    def section_title(self, offset: int) -> str:
+        """
+        Returns the heading of the section containing offset ("" before the first heading).
+        """
+        return self.section_titles[self.unit_number("section", offset)]
+
+
+def any_offset_in(offsets, start: int, end: int) -> bool:
+    """
+    True if the sorted offsets include one in [start, end).
+    """
+    position = bisect_left(offsets, start)
+    return position < len(offsets) and offsets[position] < end
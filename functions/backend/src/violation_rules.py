@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Declarative Violation Rules for HealthGuard AI.
+
+Violation checks are data, not code: compliance_rules.json lists each rule's
+trigger phrases, mitigating phrases and regulation metadata. A ViolationRuleSet
+compiles the phrases of every rule into one regular expression shaped like a
+prefix trie, so a document is scanned once, in a single linear pass, however
+many rules there are. A rule is violated when one of its triggers occurs with
+none of its mitigations nearby: in the same sentence, paragraph or section (or
+within a window of them) according to the rule's "mitigation_scope" and
+"mitigation_window", or anywhere in the document by default. Locality is
+decided by binary search over a TextIndex of the document.
+
+Phrases match case-insensitively on whole words, and a space in a phrase matches
+any run of whitespace. Run this module to measure matching throughput:
+
+    python violation_rules.py [document.txt]
+
+Author: Gemini
+Date: 2025-09-20
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+from text_index import UNITS, TextIndex, any_offset_in
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "compliance_rules.json")
+
+
+def _normalize_phrase(phrase: str) -> str:
+    return " ".join(phrase.lower().split())
+
+
+def _trie_pattern(phrases: List[str]) -> str:
+    """
+    Builds a regex alternation of phrases factored by common prefixes, so at each text
+    position the engine follows one branch per character instead of trying every phrase.
+    Longer phrases are preferred over the phrases that are their prefixes.
+    """
+    trie: Dict[str, Any] = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [
+            (r"\s+" if char == " " else re.escape(char)) + build(child)
+            for char, child in sorted(node.items()) if char
+        ]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class ViolationRuleSet:
+    """
+    A compiled set of violation rules, evaluated together in one pass over a document.
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        """
+        Args:
+            rules: Rule definitions, each with an "id", "type", "triggers" and "mitigations"
+                (lists of phrases), "description", "suggestion" and optionally "regulation",
+                "severity", "mitigation_scope" (a text unit; "document" by default) and
+                "mitigation_window" (units on either side of the trigger's that also count).
+        """
+        self.rules: List[Dict[str, Any]] = []
+        phrases = set()
+        for rule in rules:
+            if not rule.get("id") or not rule.get("triggers"):
+                raise ValueError(f"Violation rule needs an 'id' and at least one trigger: {rule}")
+            compiled = dict(rule)
+            compiled["triggers"] = [_normalize_phrase(p) for p in rule["triggers"]]
+            compiled["mitigations"] = [_normalize_phrase(p) for p in rule.get("mitigations", [])]
+            compiled["mitigation_scope"] = rule.get("mitigation_scope", "document")
+            compiled["mitigation_window"] = int(rule.get("mitigation_window", 0))
+            if compiled["mitigation_scope"] not in UNITS:
+                raise ValueError(f"Violation rule {rule['id']} has an unknown mitigation_scope; expected one of {UNITS}.")
+            phrases.update(compiled["triggers"])
+            phrases.update(compiled["mitigations"])
+            self.rules.append(compiled)
+
+        self.phrases: List[str] = sorted(phrases)
+        # The regex reports the longest phrase starting at each position; the shorter phrases
+        # that end on a word boundary inside it (e.g. "patient" in "patient data") match there too.
+        self._shorter_phrases: Dict[str, List[str]] = {
+            phrase: [
+                other for other in self.phrases
+                if len(other) < len(phrase) and phrase.startswith(other) and not phrase[len(other)].isalnum()
+            ]
+            for phrase in self.phrases
+        }
+        # The lookahead makes matches zero-width, so phrases that overlap are all found.
+        self._pattern = re.compile(r"(?<!\w)(?=(" + _trie_pattern(self.phrases) + r")(?!\w))") if self.phrases else None
+
+    @classmethod
+    def from_file(cls, path: str) -> "ViolationRuleSet":
+        """
+        Loads and compiles the rules in a JSON rule file ({"rules": [...]}).
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["rules"])
+
+    def scan(self, content: str) -> Dict[str, List[int]]:
+        """
+        Finds every rule phrase in the content in one pass.
+
+        Returns:
+            The character offsets at which each phrase found occurs, keyed by phrase.
+        """
+        matches: Dict[str, List[int]] = {}
+        if self._pattern is None:
+            return matches
+        shorter_phrases = self._shorter_phrases
+        for match in self._pattern.finditer(content.lower()):
+            text = match.group(1)
+            # Only phrases matched across unusual whitespace need normalizing.
+            phrase = text if text in shorter_phrases else _normalize_phrase(text)
+            offset = match.start()
+            offsets = matches.get(phrase)
+            if offsets is None:
+                matches[phrase] = [offset]
+            else:
+                offsets.append(offset)
+            for shorter in shorter_phrases[phrase]:
+                matches.setdefault(shorter, []).append(offset)
+        return matches
+
+    def evaluate(self, content: str, index: Optional[TextIndex] = None) -> List[Dict[str, Any]]:
+        """
+        Evaluates every rule against the content.
+
+        Args:
+            content: The document text.
+            index: The document's TextIndex, if already built; built here when a rule needs one.
+
+        Returns:
+            A violation per rule with at least one unmitigated trigger, with the first such
+            trigger (and its section) as evidence and the number of unmitigated triggers.
+        """
+        matches = self.scan(content)
+        violations = []
+        for rule in self.rules:
+            triggers = sorted((offset, p) for p in rule["triggers"] for offset in matches.get(p, ()))
+            if not triggers:
+                continue
+            mitigations = sorted(offset for p in rule["mitigations"] for offset in matches.get(p, ()))
+            scope, window = rule["mitigation_scope"], rule["mitigation_window"]
+            if scope == "document":
+                unmitigated = [] if mitigations else triggers
+            else:
+                if index is None:
+                    index = TextIndex(content)
+                unmitigated = [
+                    (offset, phrase) for offset, phrase in triggers
+                    if not any_offset_in(mitigations, *index.span(scope, offset, window))
+                ]
+            if not unmitigated:
+                continue
+
+            offset, phrase = unmitigated[0]
+            evidence = {"phrase": phrase, "offset": offset, "occurrences": len(unmitigated)}
+            if index is not None:
+                evidence["section"] = index.section_title(offset)
+            violations.append({
+                "type": rule["type"],
+                "description": rule["description"],
+                "suggestion": rule["suggestion"],
+                "rule_id": rule["id"],
+                "regulation": rule.get("regulation", ""),
+                "severity": rule.get("severity", "MEDIUM"),
+                "evidence": evidence,
+            })
+        return violations
+
+
+_default_rule_set: Optional[ViolationRuleSet] = None
+_default_rule_set_lock = threading.Lock()
+
+
+def get_rule_set() -> ViolationRuleSet:
+    """
+    Returns the rules in COMPLIANCE_RULES_PATH (compliance_rules.json by default), compiled once per process.
+    """
+    # Imported here so the rule engine itself does not need the pipeline configuration.
+    from config import COMPLIANCE_RULES_PATH
+
+    global _default_rule_set
+    with _default_rule_set_lock:
+        if _default_rule_set is None:
+            path = COMPLIANCE_RULES_PATH or DEFAULT_RULES_PATH
+            _default_rule_set = ViolationRuleSet.from_file(path)
+            logging.info(f"Compiled {len(_default_rule_set.rules)} violation rules "
+                         f"({len(_default_rule_set.phrases)} phrases) from {path}")
+        return _default_rule_set
+
+
+def measure_throughput(rule_set: ViolationRuleSet, content: str, repeat: int = 3) -> float:
+    """
+    Returns the best evaluation throughput of the rule set over the content, in MB/s.
+    """
+    size_mb = len(content.encode("utf-8")) / (1024 * 1024)
+    best = min(_timed(rule_set.evaluate, content) for _ in range(max(1, repeat)))
+    return size_mb / best if best else float("inf")
+
+
+def _timed(function, *args) -> float:
+    started = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - started
+
+
+def main():
+    """
+    Prints the matching throughput of the configured rules, and of synthetic rule sets
+    of increasing size, over a document (or generated text).
+    """
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "r", encoding="utf-8") as f:
+            content = f.read()
+    else:
+        content = ("The system shall store patient data and medical records for authorized users. "
+                   "Electronic records are retained and reviewed by the quality team.\n") * 40000
+
+    rule_set = get_rule_set()
+    print(f"{len(rule_set.rules)} configured rules: {measure_throughput(rule_set, content):.1f} MB/s")
+    for count in (100, 300, 1000):
+        synthetic = rule_set.rules + [
+            {"id": f"SYNTHETIC-{i}", "type": "TEST", "triggers": [f"synthetic trigger {i}", f"phrase{i} alpha"],
+             "mitigations": [f"synthetic mitigation {i}"], "description": "", "suggestion": ""}
+            for i in range(count)
+        ]
+        print(f"{len(synthetic)} rules: {measure_throughput(ViolationRuleSet(synthetic), content):.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,47 @@
 # python-processor/main.py
 import os
 import json
-import tempfile
-from google.cloud import storage
+import threading
+import time
+from src.config import PIPELINE_MAX_AGE_SECONDS
+from src.credential_errors import is_credentials_error
 from src.main_pipeline import RAGPipeline
 
+# Warm instances reuse one pipeline (and its clients, engine lookup and Gemini model)
+# across invocations. It is created on first use and recycled after PIPELINE_MAX_AGE_SECONDS
+# or when its credentials stop working, whether the failure was raised or answered with
+# fallback results (see RAGPipeline.credentials_error).
+
+_pipeline = None
+_pipeline_created = 0.0
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    """
+    Returns the instance's shared pipeline, creating it on first use, when it has expired or
+    when one of its clients has hit a credentials error.
+    """
+    global _pipeline, _pipeline_created
+    with _pipeline_lock:
+        expired = PIPELINE_MAX_AGE_SECONDS > 0 and time.monotonic() - _pipeline_created > PIPELINE_MAX_AGE_SECONDS
+        if _pipeline is None or expired or _pipeline.credentials_error:
+            _pipeline = RAGPipeline()
+            _pipeline_created = time.monotonic()
+        return _pipeline
+
+
+def reset_pipeline(stale=None):
+    """
+    Drops the shared pipeline so the next invocation builds fresh clients.
+    Only drops it if it is still the given stale pipeline, so concurrent resets rebuild once.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if stale is None or _pipeline is stale:
+            _pipeline = None
+
+
 def process_document(event, context):
     """
     Cloud Function triggered by a file upload to a GCS bucket.
@@ -16,28 +53,30 @@ def process_document(event, context):
     print(f"Processing file: {gcs_uri}")
 
     try:
-        # Run the existing RAG pipeline
-        pipeline = RAGPipeline()
-        results = pipeline.run_pipeline(gcs_uri)
-
-        # Save the results to a temporary file
-        _, temp_local_path = tempfile.mkstemp()
-        with open(temp_local_path, 'w') as f:
-            json.dump(results, f)
+        # Run the existing RAG pipeline, retrying once with fresh clients if credentials rotated
+        pipeline = get_pipeline()
+        try:
+            results = pipeline.run_pipeline(gcs_uri)
+            # Search and Gemini answer credential failures with fallback results rather than raising.
+            credentials_error = pipeline.credentials_error
+        except Exception as e:
+            if not is_credentials_error(e):
+                raise
+            credentials_error = e
+        if credentials_error:
+            print(f"Credentials error, rebuilding pipeline clients: {credentials_error}")
+            reset_pipeline(pipeline)
+            pipeline = get_pipeline()
+            results = pipeline.run_pipeline(gcs_uri)
 
-        # Upload the results back to GCS where the Node.js function can find it
+        # Upload the results straight from memory to GCS where the Node.js function can find it
         results_blob_name = f"results_{file_name}.json"
-        storage_client = storage.Client()
-        results_bucket = storage_client.bucket(os.environ.get('RESULTS_BUCKET'))
+        results_bucket = pipeline.storage_client.bucket(os.environ.get('RESULTS_BUCKET'))
         blob = results_bucket.blob(results_blob_name)
-        blob.upload_from_filename(temp_local_path)
+        blob.upload_from_string(json.dumps(results), content_type="application/json")
 
         print(f"Successfully processed and uploaded results to gs://{results_bucket.name}/{results_blob_name}")
 
     except Exception as e:
         print(f"Error processing document: {e}")
         # In a real app, you'd want more robust error handling, like sending a failure notification.
-    finally:
-        # Clean up the temporary file
-        if os.path.exists(temp_local_path):
-            os.remove(temp_local_path)